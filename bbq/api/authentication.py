@@ -0,0 +1,32 @@
+from rest_framework import exceptions
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+
+from authapp.backend import UserModelBackend
+from .tokens import ACCESS, TokenError, check_user, is_revoked, read_token
+
+
+class SignedTokenAuthentication(BaseAuthentication):
+    """
+    Authorization: Bearer <токен доступа из /api/token/>.
+    Подпись проверяется HMAC; пользователь берётся из кэша UserModelBackend.get_user,
+    отзыв проверяется одним запросом по уникальному индексу (is_revoked).
+    """
+    keyword = 'Bearer'
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) != 2:
+            raise exceptions.AuthenticationFailed('Invalid token header')
+        try:
+            claims = read_token(auth[1].decode(), ACCESS)
+            if is_revoked(claims, ACCESS):
+                raise TokenError('Token revoked')
+            user = check_user(claims, UserModelBackend().get_user(claims['u']))
+        except (TokenError, UnicodeError) as e:
+            raise exceptions.AuthenticationFailed(str(e))
+        return user, claims
+
+    def authenticate_header(self, request):
+        return f'{self.keyword} realm="api"'
@@ -1,3 +1,14 @@
 from django.db import models
 
-# Create your models here.
+
+class RevokedToken(models.Model):
+    """
+    Отозванный токен API (выход из приложения, использованный refresh-токен).
+    Хранится до истечения срока действия токена. Источник правды для всех процессов,
+    кэш только запоминает найденные отзывы.
+    """
+    jti = models.CharField(max_length=32, unique=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return self.jti
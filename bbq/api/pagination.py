@@ -0,0 +1,121 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from functools import reduce
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Постраничная выдача по ключу (keyset): курсор хранит значения полей
+    сортировки последней строки, следующая страница выбирается условием
+    WHERE (order_date, id) < (...) без COUNT(*) и OFFSET, поэтому глубокие
+    страницы отдаются так же быстро, как первая.
+    Старые клиенты получают весь список с ?paginate=false.
+    """
+    ordering = ('id',)  # Последнее поле должно быть уникальным, все поля в одном направлении
+    page_size = 50
+    max_page_size = 200
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    paginate_query_param = 'paginate'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def is_disabled(self, request):
+        return request.query_params.get(self.paginate_query_param, '').lower() in ('0', 'false', 'no')
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    @property
+    def fields(self):
+        return [field.lstrip('-') for field in self.ordering]
+
+    @property
+    def descending(self):
+        return self.ordering[0].startswith('-')
+
+    def encode_cursor(self, row):
+        values = [row[name] if isinstance(row, dict) else getattr(row, name) for name in self.fields]
+        data = json.dumps([value.isoformat() if hasattr(value, 'isoformat') else value for value in values])
+        return urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, token, model):
+        try:
+            values = json.loads(urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+            if not isinstance(values, list) or len(values) != len(self.fields):
+                raise ValueError
+            return [model._meta.get_field(name).to_python(value) for name, value in zip(self.fields, values)]
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    def after(self, values):
+        # (a, b) > (x, y)  ->  a > x OR (a = x AND b > y)
+        lookup = 'lt' if self.descending else 'gt'
+        conditions = []
+        for position, name in enumerate(self.fields):
+            equal = dict(zip(self.fields[:position], values[:position]))
+            conditions.append(Q(**equal, **{f'{name}__{lookup}': values[position]}))
+        return reduce(lambda left, right: left | right, conditions)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.is_disabled(request):
+            return None
+        self.request = request
+        page_size = self.get_page_size(request)
+
+        queryset = queryset.order_by(*self.ordering)
+        token = request.query_params.get(self.cursor_query_param)
+        if token:
+            queryset = queryset.filter(self.after(self.decode_cursor(token, queryset.model)))
+
+        # One extra row tells whether there is a next page
+        page = list(queryset[:page_size + 1])
+        self.next_cursor = self.encode_cursor(page[page_size - 1]) if len(page) > page_size else None
+        return page[:page_size]
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
+
+    def get_single_page_response(self, request, data):
+        """
+        Ответ в формате страницы для списков, которые не берутся из базы (корзина гостя).
+        """
+        if self.is_disabled(request):
+            return Response(data)
+        return Response({'next': None, 'results': data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class ProductPagination(KeysetPagination):
+    ordering = ('id',)
+
+
+class OrderPagination(KeysetPagination):
+    ordering = ('-order_date', '-id')
+
+
+class CartPagination(KeysetPagination):
+    ordering = ('id',)
@@ -1,5 +1,7 @@
+from django.db.models import QuerySet
 from rest_framework import serializers
 from basket.models import Category, Product, Cart, CartItem, Order
+from basket.thumbnails import thumbnail_urls
 from authapp.models import CustomUser
 
 
@@ -18,6 +20,7 @@ class ProductSerializer(serializers.ModelSerializer):
         required=False
     )
     image_url = serializers.SerializerMethodField()
+    image_sizes = serializers.SerializerMethodField()
     
     def get_image_url(self, obj):
         if obj.image:
@@ -27,9 +30,66 @@ class ProductSerializer(serializers.ModelSerializer):
             return obj.image.url
         return None
     
+    def get_image_sizes(self, obj):
+        # Pre-generated thumbnails: {alias: {'webp': url, 'jpg': url}}, None while only the original exists
+        if obj.image_processed_at is None:
+            return None
+        request = self.context.get('request')
+        return thumbnail_urls(obj.image, request.build_absolute_uri if request else None)
+    
     class Meta:
         model = Product
-        fields = ['id', 'name', 'description', 'gram', 'price', 'image', 'image_url', 'category', 'category_id']
+        fields = ['id', 'name', 'description', 'gram', 'price', 'image', 'image_url', 'image_sizes', 'category',
+                  'category_id']
+
+
+PRODUCT_VALUES = (
+    'id', 'name', 'description', 'gram', 'price', 'image', 'image_processed_at', 'category_id', 'category__name',
+    'category__slug'
+)
+
+
+def serialize_products(queryset, request=None):
+    """
+    Быстрая сериализация продуктов только для чтения: строки берутся через
+    values() с JOIN категории, словари собираются напрямую.
+    Результат совпадает с ProductSerializer(many=True).data.
+    Принимает QuerySet или уже выбранные строки PRODUCT_VALUES (страницу пагинации).
+    """
+    fields = ProductSerializer().fields
+    gram = fields['gram'].to_representation
+    price = fields['price'].to_representation
+    storage = Product._meta.get_field('image').storage
+    host = request.build_absolute_uri('/')[:-1] if request is not None else ''
+
+    def absolute(url):
+        if request is not None:
+            return host + url if url.startswith('/') and not url.startswith('//') else request.build_absolute_uri(url)
+        return url
+
+    def image_url(name):
+        return absolute(storage.url(name)) if name else None
+
+    rows = queryset.values(*PRODUCT_VALUES) if isinstance(queryset, QuerySet) else queryset
+    data = []
+    for row in rows:
+        image = image_url(row['image'])
+        data.append({
+            'id': row['id'],
+            'name': row['name'],
+            'description': row['description'],
+            'gram': gram(row['gram']) if row['gram'] is not None else None,
+            'price': price(row['price']),
+            'image': image,
+            'image_url': image,
+            'image_sizes': thumbnail_urls(row['image'], absolute) if row['image_processed_at'] else None,
+            'category': {
+                'id': row['category_id'],
+                'name': row['category__name'],
+                'slug': row['category__slug'],
+            } if row['category_id'] is not None else None,
+        })
+    return data
 
 
 class CartItemSerializer(serializers.ModelSerializer):
@@ -55,6 +115,21 @@ class CartSerializer(serializers.ModelSerializer):
         read_only_fields = ['user', 'created_at', 'total_price']
 
 
+class CartOperationSerializer(serializers.Serializer):
+    op = serializers.ChoiceField(choices=['add', 'set', 'remove'])
+    product_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1, default=1)
+
+
+class CartBatchSerializer(serializers.Serializer):
+    operations = CartOperationSerializer(many=True, allow_empty=False, max_length=100)
+
+
+class TokenObtainSerializer(serializers.Serializer):
+    username = serializers.CharField()  # Email or username
+    password = serializers.CharField(trim_whitespace=False, write_only=True)
+
+
 class OrderSerializer(serializers.ModelSerializer):
     class Meta:
         model = Order
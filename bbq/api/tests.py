@@ -1,3 +1,347 @@
-from django.test import TestCase
+import shutil
+from datetime import timedelta
+from tempfile import mkdtemp
+from unittest.mock import patch
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone
+
+from api.serializers import ProductSerializer, serialize_products
+from api.throttling import CacheCounterStore, get_counter_store
+
+from authapp.models import CustomUser
+from basket.changes import encode_token
+from basket.models import Cart, CatalogTombstone, Category, Order, Product
+
+
+class CartViewSetTest(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Шашлык')
+        self.product = Product.objects.create(name='Свинина', description='', price=500, category=category)
+
+    def test_guest_cart_lives_in_session(self):
+        response = self.client.post('/api/carts/')
+        self.assertEqual(response.status_code, 201)
+        self.assertIsNone(response.json()['id'])
+        self.client.post('/api/carts/current/add_item/', {'product_id': self.product.pk})
+        response = self.client.post('/api/carts/current/add_item/', {'product_id': self.product.pk})
+        self.assertEqual(response.status_code, 200)
+        item = response.json()['items'][0]
+        self.assertEqual(item['quantity'], 2)
+        self.assertEqual(response.json()['total_price'], '1000.00')
+        response = self.client.post('/api/carts/current/update_item/', {'item_id': item['id'], 'quantity': 3})
+        self.assertEqual(response.json()['items'][0]['quantity'], 3)
+        self.assertEqual(self.client.get('/api/carts/').json()['results'][0]['total_price'], '1500.00')
+        self.assertFalse(Cart.objects.exists())
+
+    def test_guest_checkout(self):
+        self.client.post('/api/carts/current/add_item/', {'product_id': self.product.pk})
+        response = self.client.post('/api/carts/current/checkout/', {
+            'shipping_address': 'Невский проспект, 1', 'phone_number': '+79817070306',
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Order.objects.get().total_price, 500)
+        self.assertEqual(self.client.get('/api/carts/').json()['results'], [])
+        self.assertFalse(Cart.objects.exists())
+
+    def test_guest_finds_order_by_phone_in_any_format(self):
+        self.client.post('/api/carts/current/add_item/', {'product_id': self.product.pk})
+        response = self.client.post('/api/carts/current/checkout/', {
+            'shipping_address': 'Невский проспект, 1', 'phone_number': '8 (981) 707-03-06',
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Order.objects.get().phone_number, '+79817070306')
+        orders = self.client.get('/api/orders/', {'phone_number': '+7 981 707 03 06'}).json()['results']
+        self.assertEqual([order['id'] for order in orders], [response.json()['order_id']])
+        self.assertEqual(self.client.get('/api/orders/', {'phone_number': 'не номер'}).json()['results'], [])
+        response = self.client.post('/api/carts/current/checkout/', {
+            'shipping_address': 'Невский проспект, 1', 'phone_number': '12345',
+        })
+        self.assertEqual(response.status_code, 400)
+
+    def test_user_cart_is_stored_in_database(self):
+        user = CustomUser.objects.create_user(email='user@example.com', username='user', password='secret')
+        self.client.force_login(user)
+        cart_id = self.client.post('/api/carts/').json()['id']
+        response = self.client.post(f'/api/carts/{cart_id}/add_item/', {'product_id': self.product.pk})
+        self.assertEqual(response.json()['id'], cart_id)
+        self.assertEqual(Cart.objects.get(user=user).total_price, 500)
+        item_id = response.json()['items'][0]['id']
+        response = self.client.post(f'/api/carts/{cart_id}/remove_item/', {'item_id': item_id})
+        self.assertEqual(response.json()['items'], [])
+
+    def test_batch_applies_operations_in_one_transaction(self):
+        second = Product.objects.create(name='Говядина', description='', price=700)
+        third = Product.objects.create(name='Баранина', description='', price=900)
+        user = CustomUser.objects.create_user(email='user@example.com', username='user', password='secret')
+        self.client.force_login(user)
+        cart_id = self.client.post('/api/carts/').json()['id']
+        self.client.post(f'/api/carts/{cart_id}/add_item/', {'product_id': third.pk})
+        operations = [
+            {'op': 'add', 'product_id': self.product.pk, 'quantity': 2},
+            {'op': 'add', 'product_id': self.product.pk},
+            {'op': 'set', 'product_id': second.pk, 'quantity': 4},
+            {'op': 'remove', 'product_id': third.pk},
+        ]
+        with self.assertNumQueries(12):  # Was ~50 with one request per operation
+            response = self.client.post(f'/api/carts/{cart_id}/batch/', {'operations': operations},
+                                        content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        quantities = {item['product']['id']: item['quantity'] for item in response.json()['items']}
+        self.assertEqual(quantities, {self.product.pk: 3, second.pk: 4})
+        self.assertEqual(Cart.objects.get(user=user).total_price, 4300)
+
+        response = self.client.post(f'/api/carts/{cart_id}/batch/', {'operations': [
+            {'op': 'set', 'product_id': second.pk, 'quantity': 1},
+            {'op': 'add', 'product_id': 999999},
+        ]}, content_type='application/json')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(Cart.objects.get(user=user).total_price, 4300)  # Nothing applied
+
+    def test_guest_batch_and_validation(self):
+        response = self.client.post('/api/carts/current/batch/', {'operations': [
+            {'op': 'add', 'product_id': self.product.pk, 'quantity': 2},
+        ]}, content_type='application/json')
+        self.assertEqual(response.json()['total_price'], '1000.00')
+        self.assertFalse(Cart.objects.exists())
+        response = self.client.post('/api/carts/current/batch/', {'operations': [
+            {'op': 'set', 'product_id': self.product.pk, 'quantity': 0},
+        ]}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_guest_without_cart_sees_no_carts(self):
+        self.assertEqual(self.client.get('/api/carts/').json()['results'], [])
+        self.assertFalse(Cart.objects.exists())
+
+
+class ProductReadPathTest(TestCase):
+    def setUp(self):
+        root = mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        self.enterContext(override_settings(MEDIA_ROOT=root))
+        category = Category.objects.create(name='Шашлык')
+        Product.objects.create(name='Свинина', description='Сочная', price='500.50', gram=250, category=category,
+                               image=SimpleUploadedFile('шашлык 1.jpg', b'data'))
+        Product.objects.update(image_processed_at=timezone.now())  # As if process_images has run
+        Product.objects.create(name='Лаваш', description='', price=40)
+
+    def test_matches_product_serializer(self):
+        request = RequestFactory().get('/api/products/')
+        queryset = Product.objects.order_by('pk')
+        expected = ProductSerializer(queryset, many=True, context={'request': request}).data
+        self.assertEqual(serialize_products(queryset, request), expected)
+        self.assertEqual(serialize_products(queryset), ProductSerializer(queryset, many=True).data)
+
+    def test_list_and_retrieve(self):
+        with self.assertNumQueries(2):  # Catalog version for the ETag and the products
+            products = self.client.get('/api/products/').json()['results']
+        self.assertEqual(products[0]['category']['name'], 'Шашлык')
+        self.assertTrue(products[0]['image_url'].startswith('http://testserver/media/products/'))
+        self.assertTrue(products[0]['image_sizes']['card']['webp'].startswith('http://testserver/media/products/'))
+        self.assertIsNone(products[1]['image_sizes'])
+        self.assertEqual(self.client.get(f'/api/products/{products[1]["id"]}/').json(), products[1])
+        self.assertEqual(self.client.get('/api/products/0/').status_code, 404)
+
+
+class KeysetPaginationTest(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Шашлык')
+        Product.objects.bulk_create(
+            Product(name=f'Товар {i}', description='', price=100, category=category) for i in range(7)
+        )
+
+    def walk(self, url):
+        results = []
+        while url:
+            page = self.client.get(url).json()
+            results.extend(page['results'])
+            url = page['next']
+        return results
+
+    def test_products_pages_follow_id(self):
+        ids = list(Product.objects.order_by('pk').values_list('pk', flat=True))
+        self.assertEqual([product['id'] for product in self.walk('/api/products/?page_size=3')], ids)
+        first = self.client.get('/api/products/?page_size=3').json()
+        self.assertIn('cursor=', first['next'])
+        with self.assertNumQueries(2):
+            self.client.get(first['next'])
+
+    def test_orders_pages_follow_order_date_and_id(self):
+        user = CustomUser.objects.create_user(email='user@example.com', username='user', password='secret')
+        orders = Order.objects.bulk_create(
+            Order(user=user, total_price=100, shipping_address='Адрес', phone_number='+79817070306')
+            for _ in range(5)
+        )
+        # Same order_date for two orders: the id breaks the tie
+        Order.objects.filter(pk__in=[orders[1].pk, orders[2].pk]).update(order_date=orders[0].order_date)
+        self.client.force_login(user)
+        expected = list(Order.objects.order_by('-order_date', '-id').values_list('pk', flat=True))
+        self.assertEqual([order['id'] for order in self.walk('/api/orders/?page_size=2')], expected)
+
+    def test_unpaginated_opt_in_and_invalid_cursor(self):
+        self.assertEqual(len(self.client.get('/api/products/?paginate=false').json()), 7)
+        self.assertEqual(self.client.get('/api/carts/?paginate=false').json(), [])
+        self.assertEqual(self.client.get('/api/products/?cursor=garbage').status_code, 404)
+
+
+class ConditionalGetTest(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Шашлык')
+        Product.objects.create(name='Свинина', description='', price=500, category=self.category)
+
+    def test_not_modified_before_serialization(self):
+        for url in ['/api/products/', '/api/categories/', f'/api/categories/{self.category.pk}/']:
+            response = self.client.get(url)
+            self.assertTrue(response.has_header('Last-Modified'))
+            with self.assertNumQueries(1):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(response.status_code, 304)
+
+    def test_catalog_change_invalidates_etag(self):
+        etag = self.client.get('/api/products/')['ETag']
+        Product.objects.create(name='Лаваш', description='', price=40, category=self.category)
+        response = self.client.get('/api/products/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 2)
+
+
+class ProductSearchApiTest(TestCase):
+    def test_search(self):
+        category = Category.objects.create(name='Шашлык')
+        pork = Product.objects.create(name='Шашлык из свинины', description='', price=500, category=category)
+        Product.objects.create(name='Лаваш', description='', price=40)
+        response = self.client.get('/api/products/search/', {'q': 'шашлыки'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([product['id'] for product in response.json()], [pork.pk])
+        self.assertEqual(response.json()[0]['category']['name'], 'Шашлык')
+        self.assertEqual(self.client.get('/api/products/search/').json(), [])
+
+
+class CatalogChangesTest(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Шашлык')
+        self.product = Product.objects.create(name='Свинина', description='', price=500, category=self.category)
+        self.other = Product.objects.create(name='Курица', description='', price=400)
+
+    def sync(self, token=None):
+        response = self.client.get('/api/catalog/changes/', {'since': token} if token else {})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_first_sync_returns_whole_catalog(self):
+        data = self.sync()
+        self.assertTrue(data['reset'])
+        self.assertEqual([product['id'] for product in data['products']], [self.product.pk, self.other.pk])
+        self.assertEqual(data['categories'], [{'id': self.category.pk, 'name': 'Шашлык', 'slug': self.category.slug}])
+
+    def test_only_changes_since_token(self):
+        past = timezone.now() - timedelta(minutes=10)
+        Product.objects.update(updated_at=past)
+        Category.objects.update(updated_at=past)
+        token = encode_token(past + timedelta(minutes=1))
+        with self.assertNumQueries(3):  # Categories, products, tombstones
+            data = self.sync(token)
+        self.assertFalse(data['reset'])
+        self.assertEqual((data['categories'], data['products']), ([], []))
+
+        self.other.price = 450
+        self.other.save()
+        category_id = self.category.pk
+        self.category.delete()
+        data = self.sync(token)
+        self.assertEqual(data['deleted'], {'categories': [category_id], 'products': []})
+        # Products of the deleted category lost it and are sent again
+        self.assertEqual({product['id'] for product in data['products']}, {self.product.pk, self.other.pk})
+        self.assertEqual(CatalogTombstone.objects.get().object_id, category_id)
+
+        product_id = self.product.pk
+        self.product.delete()
+        self.assertEqual(self.sync(token)['deleted']['products'], [product_id])
+
+    def test_invalid_or_expired_token(self):
+        response = self.client.get('/api/catalog/changes/', {'since': 'garbage'})
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(self.sync(encode_token(timezone.now() - timedelta(days=365)))['reset'])
+
+
+class TokenAuthenticationTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user(email='user@example.com', username='user', password='secret')
+
+    def obtain(self):
+        response = self.client.post('/api/token/', {'username': 'user@example.com', 'password': 'secret'})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def me(self, access):
+        return self.client.get('/api/users/me/', HTTP_AUTHORIZATION=f'Bearer {access}')
+
+    def test_access_token_is_checked_with_one_query(self):
+        access = self.obtain()['access']
+        self.assertEqual(self.me(access).json()['email'], 'user@example.com')
+        with self.assertNumQueries(1):  # The revocation table; the user comes from the cache
+            self.assertEqual(self.me(access).status_code, 200)
+        self.assertEqual(self.me(access[:-1] + 'x').status_code, 401)
+        response = self.client.post('/api/token/', {'username': 'user@example.com', 'password': 'wrong'})
+        self.assertEqual(response.status_code, 401)
+
+    def test_refresh_token_works_once(self):
+        refresh = self.obtain()['refresh']
+        response = self.client.post('/api/token/refresh/', {'refresh': refresh})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.me(response.json()['access']).status_code, 200)
+        cache.clear()  # The database copy of the denylist is authoritative for refresh tokens
+        self.assertEqual(self.client.post('/api/token/refresh/', {'refresh': refresh}).status_code, 401)
+
+    def test_revoke_and_password_change(self):
+        tokens = self.obtain()
+        self.client.post('/api/token/revoke/', tokens)
+        self.assertEqual(self.me(tokens['access']).status_code, 401)
+        cache.clear()  # Another worker: its local cache has never seen the revoke
+        self.assertEqual(self.me(tokens['access']).status_code, 401)
+        self.assertEqual(self.client.post('/api/token/refresh/', {'refresh': tokens['refresh']}).status_code, 401)
+
+        access = self.obtain()['access']
+        self.user.set_password('changed')
+        self.user.save()
+        self.assertEqual(self.me(access).status_code, 401)
+
+
+@override_settings(
+    REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {
+        'cart_create': '2/minute', 'checkout': '100/hour', 'order_lookup': '2/minute', 'token': '100/hour',
+    }},
+    API_THROTTLE_STORE='api.throttling.MemoryCounterStore',
+)
+class ThrottlingTest(TestCase):
+    def setUp(self):
+        self.enterContext(patch('api.throttling.time', return_value=1_000_000.0))  # One fixed window
+
+    def tearDown(self):
+        get_counter_store().clear()
+
+    def test_guest_is_limited_per_ip(self):
+        for _ in range(2):
+            self.assertEqual(self.client.get('/api/orders/', {'phone_number': '+79817070306'}).status_code, 200)
+        response = self.client.get('/api/orders/', {'phone_number': '+79817070307'})
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+        response = self.client.get('/api/orders/', {'phone_number': '+79817070306'}, REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(response.status_code, 200)
+
+    def test_user_is_limited_per_account(self):
+        user = CustomUser.objects.create_user(email='user@example.com', username='user', password='secret')
+        self.client.force_login(user)
+        statuses = [self.client.post('/api/carts/', REMOTE_ADDR=f'10.0.0.{i}').status_code for i in range(3)]
+        self.assertEqual(statuses, [201, 200, 429])  # The second create returns the same cart
+        for _ in range(3):  # Users read their own orders without a limit
+            self.assertEqual(self.client.get('/api/orders/').status_code, 200)
+
+    def test_cache_store_counts_atomically(self):
+        store = CacheCounterStore()
+        self.assertEqual([store.incr('throttle:test', 60) for _ in range(3)], [1, 2, 3])
+        cache.delete('throttle:test')
@@ -0,0 +1,139 @@
+from functools import lru_cache, wraps
+from math import ceil
+from threading import Lock
+from time import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.module_loading import import_string
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+@lru_cache(maxsize=None)
+def parse_rate(rate):
+    """
+    '10/hour' -> (10, 3600). Как в DRF, значим только первый символ периода.
+    """
+    count, period = rate.split('/')
+    return int(count), PERIODS[period[0]]
+
+
+class MemoryCounterStore:
+    """
+    Счётчики в памяти процесса: для одного процесса и тестов.
+    """
+    prune_size = 10000
+
+    def __init__(self):
+        self.counters = {}
+        self.lock = Lock()
+
+    def incr(self, key, timeout):
+        now = time()
+        with self.lock:
+            expires, count = self.counters.get(key, (0, 0))
+            if expires <= now:
+                if len(self.counters) >= self.prune_size:
+                    self.counters = {k: v for k, v in self.counters.items() if v[0] > now}
+                expires, count = now + timeout, 0
+            self.counters[key] = (expires, count + 1)
+            return count + 1
+
+    def clear(self):
+        with self.lock:
+            self.counters.clear()
+
+
+class CacheCounterStore:
+    """
+    Счётчики в кэше Django (CACHES): add + incr атомарны в memcached, Redis
+    и локальном кэше, поэтому общий лимит соблюдается всеми процессами.
+    """
+
+    def incr(self, key, timeout):
+        if cache.add(key, 1, timeout):
+            return 1
+        try:
+            return cache.incr(key)
+        except ValueError:
+            # The window expired between add() and incr()
+            cache.add(key, 1, timeout)
+            return 1
+
+
+@lru_cache(maxsize=None)
+def _load_store(path):
+    return import_string(path)()
+
+
+def get_counter_store():
+    return _load_store(settings.API_THROTTLE_STORE)
+
+
+class ActionRateThrottle(BaseThrottle):
+    """
+    Лимит запросов на действие ViewSet'а: view.throttle_scopes = {'checkout': 'checkout', ...},
+    частоты берутся из REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'].
+    Пользователь считается по id, гость — отдельно по IP и по сессии
+    (сброс cookie не обходит лимит по IP). Окно фиксированное: один
+    атомарный инкремент на каждый счётчик.
+    """
+    scope_attr = 'throttle_scopes'
+
+    def get_scope(self, view):
+        return getattr(view, self.scope_attr, {}).get(getattr(view, 'action', None))
+
+    def get_idents(self, request):
+        if request.user and request.user.is_authenticated:
+            return [f'user:{request.user.pk}']
+        idents = [f'ip:{self.get_ident(request)}']
+        session_key = getattr(getattr(request, 'session', None), 'session_key', None)
+        if session_key:
+            idents.append(f'session:{session_key}')
+        return idents
+
+    def allow_request(self, request, view):
+        return self.allow_scope(request, self.get_scope(view))
+
+    def allow_scope(self, request, scope):
+        self.retry_after = None
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(scope) if scope else None
+        if rate is None:
+            return True
+        limit, period = parse_rate(rate)
+        now = time()
+        window = int(now // period)
+        store = get_counter_store()
+        allowed = True
+        for ident in self.get_idents(request):
+            if store.incr(f'throttle:{scope}:{ident}:{window}', period) > limit:
+                allowed = False
+        if not allowed:
+            self.retry_after = (window + 1) * period - now
+        return allowed
+
+    def wait(self):
+        return self.retry_after
+
+
+def throttle(scope, methods=('POST',)):
+    """
+    Тот же лимит для обычных Django-представлений: @throttle('checkout').
+    Считаются только запросы с методами methods, сверх лимита — 429 с Retry-After.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if request.method in methods:
+                limiter = ActionRateThrottle()
+                if not limiter.allow_scope(request, scope):
+                    response = HttpResponse('Слишком много запросов, попробуйте позже.', status=429)
+                    response['Retry-After'] = str(ceil(limiter.wait()))
+                    return response
+            return view_func(request, *args, **kwargs)
+        return wrapper
+    return decorator
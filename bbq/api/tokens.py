@@ -0,0 +1,103 @@
+import secrets
+from datetime import datetime, timezone as dt_timezone
+from time import time
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import RevokedToken
+
+ACCESS = 'access'
+REFRESH = 'refresh'
+
+
+class TokenError(Exception):
+    pass
+
+
+def _salt(kind):
+    return f'api.token.{kind}'
+
+
+def _password_fingerprint(user):
+    # Changes with the password hash, so a password change invalidates every token
+    return user.get_session_auth_hash()[:12]
+
+
+def make_token(user, kind):
+    ttl = settings.API_ACCESS_TOKEN_TTL if kind == ACCESS else settings.API_REFRESH_TOKEN_TTL
+    claims = {
+        'u': user.pk,
+        'j': secrets.token_hex(8),
+        'e': int(time()) + ttl,
+        'h': _password_fingerprint(user),
+    }
+    return signing.dumps(claims, salt=_salt(kind))
+
+
+def issue_tokens(user):
+    """
+    Пара токенов для пользователя, вошедшего по логину и паролю.
+    """
+    return {
+        'access': make_token(user, ACCESS),
+        'refresh': make_token(user, REFRESH),
+        'token_type': 'Bearer',
+        'expires_in': settings.API_ACCESS_TOKEN_TTL,
+    }
+
+
+def read_token(token, kind):
+    """
+    Проверка подписи и срока действия токена, только HMAC, без базы и кэша.
+    Возвращает утверждения токена, TokenError для испорченного или просроченного.
+    """
+    try:
+        claims = signing.loads(token, salt=_salt(kind))
+    except signing.BadSignature:
+        raise TokenError('Invalid token')
+    if not isinstance(claims, dict) or claims.get('e', 0) < time():
+        raise TokenError('Token expired')
+    return claims
+
+
+def check_user(claims, user):
+    if user is None or claims['h'] != _password_fingerprint(user):
+        raise TokenError('Token revoked')
+    return user
+
+
+def _revoked_key(jti):
+    return f'api:revoked:{jti}'
+
+
+def is_revoked(claims, kind):
+    """
+    Проверка по списку отозванных: сначала кэш, при промахе — таблица RevokedToken
+    (запрос по уникальному индексу). Кэш может быть своим у каждого процесса
+    (locmem) или потерять запись, таблица общая для всех.
+    Найденный в таблице отзыв кладётся в кэш до конца срока токена.
+    """
+    jti = claims['j']
+    if cache.get(_revoked_key(jti)):
+        return True
+    if not RevokedToken.objects.filter(jti=jti).exists():
+        return False
+    cache.set(_revoked_key(jti), True, max(claims['e'] - int(time()), 1))
+    return True
+
+
+def revoke(claims):
+    """
+    Отзыв токена до конца его срока действия. Истёкшие записи удаляются заодно.
+    """
+    remaining = claims['e'] - int(time())
+    if remaining <= 0:
+        return
+    cache.set(_revoked_key(claims['j']), True, remaining)
+    RevokedToken.objects.filter(expires_at__lt=timezone.now()).delete()
+    RevokedToken.objects.get_or_create(
+        jti=claims['j'], defaults={'expires_at': datetime.fromtimestamp(claims['e'], dt_timezone.utc)}
+    )
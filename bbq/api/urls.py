@@ -2,16 +2,18 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 
 from .views import (
-    CategoryViewSet, ProductViewSet, CartViewSet, 
-    OrderViewSet, UserViewSet
+    CategoryViewSet, ProductViewSet, CatalogViewSet, CartViewSet, 
+    OrderViewSet, UserViewSet, TokenViewSet
 )
 
 router = DefaultRouter()
 router.register(r'categories', CategoryViewSet)
 router.register(r'products', ProductViewSet)
+router.register(r'catalog', CatalogViewSet, basename='catalog')
 router.register(r'carts', CartViewSet, basename='cart')
 router.register(r'orders', OrderViewSet, basename='order')
 router.register(r'users', UserViewSet, basename='user')
+router.register(r'token', TokenViewSet, basename='token')
 
 app_name = 'api'
 
@@ -1,16 +1,30 @@
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
-from django.shortcuts import get_object_or_404
+from django.contrib.auth import authenticate
+from django.http import Http404
+from django.utils.decorators import method_decorator
 
+from . import tokens
+from .pagination import CartPagination, OrderPagination, ProductPagination
 from .serializers import (
     CategorySerializer, ProductSerializer, CartSerializer, 
-    CartItemSerializer, OrderSerializer, UserSerializer
+    CartItemSerializer, CartBatchSerializer, OrderSerializer, UserSerializer, TokenObtainSerializer, PRODUCT_VALUES,
+    serialize_products
 )
-from basket.models import Category, Product, Cart, CartItem, Order
+from basket.models import Category, Product, Order
+from basket.changes import catalog_changes, decode_token
+from basket.checkout import EmptyCartError, IdempotencyKeyReused, find_order, place_order
+from basket.conditional import catalog_condition
+from basket.phones import normalize_phone
+from basket.search import SEARCH_LIMIT, search_products
+from authapp.backend import UserModelBackend
 from authapp.models import CustomUser
 
 
+@method_decorator(catalog_condition, name='list')
+@method_decorator(catalog_condition, name='retrieve')
 class CategoryViewSet(viewsets.ModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
@@ -22,13 +36,18 @@ class CategoryViewSet(viewsets.ModelViewSet):
         return super().get_permissions()
 
 
+@method_decorator(catalog_condition, name='list')
+@method_decorator(catalog_condition, name='retrieve')
+@method_decorator(catalog_condition, name='by_category')
+@method_decorator(catalog_condition, name='search')
 class ProductViewSet(viewsets.ModelViewSet):
-    queryset = Product.objects.all()
+    queryset = Product.objects.select_related('category')
     serializer_class = ProductSerializer
     permission_classes = [permissions.IsAdminUser]
+    pagination_class = ProductPagination
     
     def get_permissions(self):
-        if self.action in ['list', 'retrieve']:
+        if self.action in ['list', 'retrieve', 'search']:
             return [permissions.AllowAny()]
         return super().get_permissions()
     
@@ -37,6 +56,25 @@ class ProductViewSet(viewsets.ModelViewSet):
         context['request'] = self.request
         return context
     
+    # Read-only actions skip ModelSerializer and build the same JSON from values()
+    def list_products(self, queryset):
+        page = self.paginate_queryset(queryset.values(*PRODUCT_VALUES))
+        if page is None:
+            return Response(serialize_products(queryset, self.request))
+        return self.get_paginated_response(serialize_products(page, self.request))
+    
+    def list(self, request, *args, **kwargs):
+        return self.list_products(self.filter_queryset(self.get_queryset()))
+    
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            data = serialize_products(self.get_queryset().filter(pk=kwargs['pk']), request)
+        except (TypeError, ValueError):
+            data = None
+        if not data:
+            raise Http404
+        return Response(data[0])
+    
     @action(detail=False, methods=['get'])
     def by_category(self, request):
         category_id = request.query_params.get('category_id')
@@ -44,42 +82,96 @@ class ProductViewSet(viewsets.ModelViewSet):
             products = Product.objects.filter(category_id=category_id)
         else:
             products = Product.objects.all()
-        serializer = self.get_serializer(products, many=True)
-        return Response(serializer.data)
+        return self.list_products(products)
+    
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        # Full-text search, the most relevant products first
+        query = request.query_params.get('q', '').strip()
+        try:
+            limit = min(max(int(request.query_params.get('limit', SEARCH_LIMIT)), 1), 100)
+        except ValueError:
+            limit = SEARCH_LIMIT
+        ids = search_products(query, limit) if query else []
+        products = serialize_products(self.get_queryset().filter(pk__in=ids), request)
+        products = {product['id']: product for product in products}
+        return Response([products[pk] for pk in ids if pk in products])
+
+
+class CatalogViewSet(viewsets.ViewSet):
+    permission_classes = [permissions.AllowAny]
+    
+    @action(detail=False, methods=['get'])
+    def changes(self, request):
+        # Delta sync: only rows changed since the token, ids of deleted ones and the next token
+        token = request.query_params.get('since')
+        try:
+            since = decode_token(token) if token else None
+        except ValueError:
+            raise ValidationError({'since': 'Invalid sync token'})
+        changes = catalog_changes(since)
+        return Response({
+            'token': changes['token'],
+            'reset': changes['reset'],
+            'categories': CategorySerializer(changes['categories'], many=True).data,
+            'products': serialize_products(changes['products'], request),
+            'deleted': changes['deleted'],
+        })
 
 
 class CartViewSet(viewsets.ModelViewSet):
     serializer_class = CartSerializer
     permission_classes = [permissions.AllowAny]  # Allow any user, including unauthenticated
+    pagination_class = CartPagination
+    throttle_scopes = {'create': 'cart_create', 'checkout': 'checkout'}
     
     def get_queryset(self):
-        if self.request.user.is_authenticated:
-            return Cart.objects.filter(user=self.request.user)
-        else:
-            # For guest users, try to get cart from session
-            cart_id = self.request.session.get('cart_id')
-            if cart_id:
-                return Cart.objects.filter(id=cart_id)
-            return Cart.objects.none()
+        # Carts of the current user, guest carts live in the session
+        queryset = self.request.cart.queryset()
+        if self.action in ['list', 'retrieve']:
+            queryset = queryset.prefetch_related('items__product')
+        return queryset
     
-    def perform_create(self, serializer):
+    def get_cart(self):
+        # Guests always work with their session cart, whatever pk is in the URL
         if self.request.user.is_authenticated:
-            serializer.save(user=self.request.user)
-        else:
-            # For guest users, create a cart without a user
-            cart = serializer.save(user=None)
-            self.request.session['cart_id'] = cart.id
+            self.request.cart.remember(self.get_object())
+        return self.request.cart
+    
+    def cart_response(self, **kwargs):
+        serializer = CartSerializer(self.request.cart, context=self.get_serializer_context())
+        return Response(serializer.data, **kwargs)
+    
+    def list(self, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return super().list(request, *args, **kwargs)
+        carts = [request.cart] if request.cart.items else []
+        data = CartSerializer(carts, many=True, context=self.get_serializer_context()).data
+        return self.paginator.get_single_page_response(request, data)
+    
+    def retrieve(self, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return super().retrieve(request, *args, **kwargs)
+        return self.cart_response()
+    
+    def create(self, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            # One cart per user: creating it again returns the existing cart
+            created = request.cart.instance is None
+            request.cart.get_or_create()
+            return self.cart_response(status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+        # Guest carts are stored in the session until checkout
+        return self.cart_response(status=status.HTTP_201_CREATED)
     
     @action(detail=True, methods=['post'])
     def add_item(self, request, pk=None):
         try:
-            cart = self.get_object()
+            cart = self.get_cart()
         except:
             # If no cart exists or user doesn't have permission to access it,
-            # create a new cart
-            cart = Cart.objects.create(user=request.user if request.user.is_authenticated else None)
-            if not request.user.is_authenticated:
-                request.session['cart_id'] = cart.id
+            # use the request cart, creating it if needed
+            request.cart.get_or_create()
+            cart = request.cart
         
         product_id = request.data.get('product_id')
         quantity = int(request.data.get('quantity', 1))
@@ -91,32 +183,19 @@ class CartViewSet(viewsets.ModelViewSet):
             )
         
         try:
-            product = Product.objects.get(id=product_id)
-        except Product.DoesNotExist:
+            cart.add(product_id, quantity)
+        except (ValueError, Product.DoesNotExist):
             return Response(
                 {'error': 'Product not found'}, 
                 status=status.HTTP_404_NOT_FOUND
             )
         
-        cart_item, created = CartItem.objects.get_or_create(
-            cart=cart, 
-            product=product,
-            defaults={'quantity': quantity}
-        )
-        
-        if not created:
-            cart_item.quantity += quantity
-            cart_item.save()
-        
-        cart.update_total_price()
-        
-        serializer = CartSerializer(cart, context={'request': request})
-        return Response(serializer.data)
+        return self.cart_response()
     
     @action(detail=True, methods=['post'])
     def remove_item(self, request, pk=None):
         try:
-            cart = self.get_object()
+            cart = self.get_cart()
         except:
             return Response(
                 {'error': 'Cart not found'}, 
@@ -131,22 +210,19 @@ class CartViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        try:
-            cart_item = CartItem.objects.get(id=item_id, cart=cart)
-            cart_item.delete()
-            cart.update_total_price()
-            serializer = CartSerializer(cart, context={'request': request})
-            return Response(serializer.data)
-        except CartItem.DoesNotExist:
+        cart_item = cart.find_item(item_id)
+        if cart_item is None:
             return Response(
                 {'error': 'Cart item not found'}, 
                 status=status.HTTP_404_NOT_FOUND
             )
+        cart.remove(cart_item.product_id)
+        return self.cart_response()
     
     @action(detail=True, methods=['post'])
     def update_item(self, request, pk=None):
         try:
-            cart = self.get_object()
+            cart = self.get_cart()
         except:
             return Response(
                 {'error': 'Cart not found'}, 
@@ -175,33 +251,57 @@ class CartViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        try:
-            cart_item = CartItem.objects.get(id=item_id, cart=cart)
-            cart_item.quantity = quantity
-            cart_item.save()
-            cart.update_total_price()
-            serializer = CartSerializer(cart, context={'request': request})
-            return Response(serializer.data)
-        except CartItem.DoesNotExist:
+        cart_item = cart.find_item(item_id)
+        if cart_item is None:
             return Response(
                 {'error': 'Cart item not found'}, 
                 status=status.HTTP_404_NOT_FOUND
             )
+        cart.set(cart_item.product_id, quantity)
+        return self.cart_response()
     
     @action(detail=True, methods=['post'])
-    def checkout(self, request, pk=None):
+    def batch(self, request, pk=None):
+        # Several add/set/remove operations in one request and one transaction
         try:
-            cart = self.get_object()
-        except:
+            self.get_cart()
+        except Http404:
+            pass  # Like add_item: the request cart is created if needed
+        
+        serializer = CartBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        operations = [
+            (operation['op'], operation['product_id'], operation['quantity'])
+            for operation in serializer.validated_data['operations']
+        ]
+        
+        try:
+            request.cart.apply(operations)
+        except Product.DoesNotExist:
             return Response(
-                {'error': 'Cart not found'}, 
+                {'error': 'Product not found'}, 
                 status=status.HTTP_404_NOT_FOUND
             )
         
-        if not cart.items.exists():
+        return self.cart_response()
+    
+    @action(detail=True, methods=['post'])
+    def checkout(self, request, pk=None):
+        # Clients may repeat a checkout with the same key and get the original order back
+        idempotency_key = request.headers.get('Idempotency-Key') or request.data.get('idempotency_key')
+        try:
+            self.get_cart()
+        except:
+            # A replay may arrive after the first checkout has already deleted the cart
+            try:
+                existing = find_order(request, idempotency_key)
+            except IdempotencyKeyReused:
+                return self.key_reused_response()
+            if existing is not None:
+                return Response({'message': 'Order already created', 'order_id': existing.id})
             return Response(
-                {'error': 'Cart is empty'}, 
-                status=status.HTTP_400_BAD_REQUEST
+                {'error': 'Cart not found'}, 
+                status=status.HTTP_404_NOT_FOUND
             )
         
         shipping_address = request.data.get('shipping_address')
@@ -213,37 +313,54 @@ class CartViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Create order items string
-        order_items_string = ", ".join(
-            [f"{item.product.name}: {item.quantity} шт" for item in cart.items.all()]
-        )
+        phone_number = normalize_phone(phone_number)
+        if phone_number is None:
+            return Response(
+                {'error': 'Invalid phone number'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
-        # Create order - set user to None for guest users
-        order = Order.objects.create(
-            user=request.user if request.user.is_authenticated else None,
-            products=order_items_string,
+        order = Order(
             shipping_address=shipping_address,
             phone_number=phone_number,
-            total_price=cart.total_price,
             status='pending'
         )
+        try:
+            order, created = place_order(request, order, idempotency_key)
+        except EmptyCartError:
+            return Response(
+                {'error': 'Cart is empty'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        except IdempotencyKeyReused:
+            return self.key_reused_response()
         
-        # Clear cart
-        cart.delete()
-        
-        # Clear cart_id from session for guest users
-        if not request.user.is_authenticated and 'cart_id' in request.session:
-            del request.session['cart_id']
-        
+        if not created:
+            return Response({'message': 'Order already created', 'order_id': order.id})
         return Response(
             {'message': 'Order created successfully', 'order_id': order.id},
             status=status.HTTP_201_CREATED
         )
+    
+    def key_reused_response(self):
+        # The key belongs to another customer's order: nothing about it is returned
+        return Response(
+            {'error': 'Idempotency key already used'}, 
+            status=status.HTTP_409_CONFLICT
+        )
 
 
 class OrderViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = OrderSerializer
     permission_classes = [permissions.AllowAny]  # Allow any user, including unauthenticated
+    pagination_class = OrderPagination
+    throttle_scopes = {'list': 'order_lookup', 'retrieve': 'order_lookup'}
+    
+    def get_throttles(self):
+        # Only guest lookups by phone number are limited, users see their own orders
+        if self.request.user.is_authenticated:
+            return []
+        return super().get_throttles()
     
     def get_queryset(self):
         if self.request.user.is_authenticated:
@@ -251,7 +368,8 @@ class OrderViewSet(viewsets.ReadOnlyModelViewSet):
             return Order.objects.filter(user=self.request.user)
         else:
             # For guest users, return orders by phone number if provided
-            phone_number = self.request.query_params.get('phone_number')
+            # Any format of the number finds the order: both sides are E.164
+            phone_number = normalize_phone(self.request.query_params.get('phone_number'))
             if phone_number:
                 return Order.objects.filter(phone_number=phone_number, user=None)
             return Order.objects.none()
@@ -268,3 +386,53 @@ class UserViewSet(viewsets.ReadOnlyModelViewSet):
     def me(self, request):
         serializer = self.get_serializer(request.user)
         return Response(serializer.data)
+
+
+class TokenViewSet(viewsets.ViewSet):
+    permission_classes = [permissions.AllowAny]
+    authentication_classes = []  # Credentials come in the body, no session or CSRF
+    throttle_scopes = {'create': 'token'}  # Password guessing, and PBKDF2 is expensive
+    
+    def create(self, request):
+        # Email (or username) and password are checked once, then the app sends the access token
+        serializer = TokenObtainSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user = authenticate(request, **serializer.validated_data)
+        if user is None:
+            return Response(
+                {'error': 'Invalid credentials'}, 
+                status=status.HTTP_401_UNAUTHORIZED
+            )
+        return Response(tokens.issue_tokens(user))
+    
+    @action(detail=False, methods=['post'])
+    def refresh(self, request):
+        token = request.data.get('refresh')
+        if not token:
+            return Response(
+                {'error': 'Refresh token is required'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            claims = tokens.read_token(token, tokens.REFRESH)
+            if tokens.is_revoked(claims, tokens.REFRESH):
+                raise tokens.TokenError('Token revoked')
+            user = tokens.check_user(claims, UserModelBackend().get_user(claims['u']))
+        except tokens.TokenError as e:
+            return Response({'error': str(e)}, status=status.HTTP_401_UNAUTHORIZED)
+        # Every refresh token works once: a stolen copy stops working after the app uses it
+        tokens.revoke(claims)
+        return Response(tokens.issue_tokens(user))
+    
+    @action(detail=False, methods=['post'])
+    def revoke(self, request):
+        # Logout: both tokens of the app stop working
+        for kind in (tokens.ACCESS, tokens.REFRESH):
+            token = request.data.get(kind)
+            if not token:
+                continue
+            try:
+                tokens.revoke(tokens.read_token(token, kind))
+            except tokens.TokenError:
+                pass  # Already invalid
+        return Response(status=status.HTTP_204_NO_CONTENT)
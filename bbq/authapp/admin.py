@@ -8,3 +8,10 @@ class CustomUserAdmin(admin.ModelAdmin):
     search_fields = ["id", "email", "username", "is_active", "date_joined"]
     ordering = ["-date_joined"]
     # list_filter = ('id', 'date_joined')
+
+
+@admin.register(models.EmailJob)
+class EmailJobAdmin(admin.ModelAdmin):
+    list_display = ["subject", "status", "attempts", "run_at", "sent_at"]
+    list_filter = ["status"]
+    search_fields = ["subject", "last_error"]
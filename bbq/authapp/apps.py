@@ -5,3 +5,6 @@ class AuthappConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "authapp"
     verbose_name = 'Авторизация'
+
+    def ready(self):
+        from . import signals  # noqa: F401
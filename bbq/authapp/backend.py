@@ -1,32 +1,56 @@
+from django.conf import settings
 from django.contrib.auth.backends import ModelBackend, get_user_model
-from django.core.exceptions import MultipleObjectsReturned
+from django.core.cache import cache
 from django.db.models import Q
+from django.db.models.functions import Lower
 
 UserModel = get_user_model()
 
 
+def user_cache_key(user_id):
+    return f"auth:user:{user_id}"
+
+
+def forget_user(user_id):
+    """
+    Сброс закэшированного пользователя после изменения (сигналы post_save/post_delete).
+    """
+    cache.delete(user_cache_key(user_id))
+
+
 class UserModelBackend(ModelBackend):
     """
-    Переопределение авторизации
+    Переопределение авторизации: вход по email без учёта регистра или по логину.
     """
 
     def authenticate(self, request, username=None, password=None, **kwargs):
-        try:
-            user = UserModel.objects.get(
-                Q(username=username) | Q(email__iexact=username)
-            )
-        except UserModel.DoesNotExist:
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
             return None
-        except MultipleObjectsReturned:
-            return UserModel.objects.filter(email=username).order_by("id").first()
-        else:
-            if user.check_password(password) and self.user_can_authenticate(user):
-                return user
+        # LOWER(email) matches the customuser_email_lower_idx expression, so both branches use an index
+        users = list(
+            UserModel.objects.annotate(email_lower=Lower("email"))
+            .filter(Q(username=username) | Q(email_lower=username.lower()))
+            .order_by("id")[:3]
+        )
+        if not users:
+            # Hash anyway so the response time does not reveal whether the user exists
+            UserModel().set_password(password)
+            return None
+        # Exact email first, then username, then email in another case
+        user = min(users, key=lambda candidate: (candidate.email != username, candidate.username != username))
+        if user.check_password(password) and self.user_can_authenticate(user):
+            return user
 
     def get_user(self, user_id):
-        try:
-            user = UserModel.objects.get(pk=user_id)
-        except UserModel.DoesNotExist:
-            return None
+        key = user_cache_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            try:
+                user = UserModel.objects.get(pk=user_id)
+            except UserModel.DoesNotExist:
+                return None
+            cache.set(key, user, settings.AUTH_USER_CACHE_TIMEOUT)
 
         return user if self.user_can_authenticate(user) else None
@@ -1,4 +1,3 @@
-import os
 
 from django.contrib.auth import get_user_model
 from django.contrib.auth.forms import UserCreationForm, UsernameField, UserChangeForm
@@ -37,13 +36,6 @@ class CustomUserChangeForm(UserChangeForm):
         )
         field_classes = {"email": UsernameField}
 
-    def clean_avatar(self):
-        arg_as_str = "avatar"
-        if arg_as_str in self.changed_data and self.instance.avatar:
-            if os.path.exists(self.instance.avatar.path):
-                os.remove(self.instance.avatar.path)
-        return self.cleaned_data.get(arg_as_str)
-
     def clean_age(self):
         data = self.cleaned_data.get("age")
         if data:
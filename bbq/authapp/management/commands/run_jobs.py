@@ -0,0 +1,24 @@
+from time import sleep
+
+from django.core.management.base import BaseCommand
+
+from authapp.tasks import run_email_jobs
+
+
+class Command(BaseCommand):
+    help = "Отправка писем из очереди EmailJob"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Обработать очередь один раз и выйти")
+        parser.add_argument("--interval", type=float, default=5, help="Пауза между проверками очереди, с")
+        parser.add_argument("--batch-size", type=int, default=50, help="Писем на одно SMTP-соединение")
+
+    def handle(self, *args, once, interval, batch_size, **options):
+        while True:
+            sent, failed = run_email_jobs(batch_size)
+            if sent or failed:
+                self.stdout.write(f"Отправлено: {sent}, ошибок: {failed}")
+            if once:
+                break
+            if not sent and not failed:
+                sleep(interval)
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.4 on 2026-10-18 03:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authapp', '0002_emailjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='avatar_height',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Высота фото'),
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='avatar_placeholder',
+            field=models.TextField(blank=True, editable=False, verbose_name='Превью фото'),
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='avatar_processed_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Фото обработано'),
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='avatar_width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Ширина фото'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.1.4 on 2026-10-18 04:30
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def move_failures(apps, schema_editor):
+    """
+    Неудачная обработка раньше отмечалась avatar_processed_at без размеров.
+    """
+    CustomUser = apps.get_model('authapp', 'CustomUser')
+    CustomUser.objects.filter(avatar_processed_at__isnull=False, avatar_width__isnull=True).update(
+        avatar_failed_at=F('avatar_processed_at'), avatar_processed_at=None
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authapp', '0004_customuser_email_lower_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='avatar_failed_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Фото не удалось обработать'),
+        ),
+        migrations.RunPython(move_failures, migrations.RunPython.noop),
+    ]
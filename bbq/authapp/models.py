@@ -6,6 +6,8 @@ from django.contrib.auth.base_user import AbstractBaseUser
 from django.contrib.auth.models import PermissionsMixin, UserManager
 from django.contrib.auth.validators import ASCIIUsernameValidator
 from django.db import models
+from django.db.models.functions import Lower
+from django.utils import timezone
 
 
 
@@ -34,6 +36,12 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
     avatar = models.ImageField(
         "Ваше фото", upload_to=users_avatars_path, blank=True, null=True
     )
+    # Заполняются обработчиком process_images после нормализации фото
+    avatar_width = models.PositiveIntegerField("Ширина фото", null=True, blank=True, editable=False)
+    avatar_height = models.PositiveIntegerField("Высота фото", null=True, blank=True, editable=False)
+    avatar_placeholder = models.TextField("Превью фото", blank=True, editable=False)
+    avatar_processed_at = models.DateTimeField("Фото обработано", null=True, blank=True, editable=False)
+    avatar_failed_at = models.DateTimeField("Фото не удалось обработать", null=True, blank=True, editable=False)
     email = models.CharField(
         "адрес электронной почты",
         max_length=256,
@@ -63,7 +71,43 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
     class Meta:
         verbose_name = "Пользователь"
         verbose_name_plural = "Пользователи"
+        # Вход по email без учёта регистра (UserModelBackend) ищет по LOWER(email)
+        indexes = [models.Index(Lower("email"), name="customuser_email_lower_idx")]
 
     def get_full_name(self):
         full_name = "%s %s" % (self.first_name, self.last_name)
         return full_name.strip()
+
+
+class EmailJob(models.Model):
+    """
+    Письмо в очереди на отправку. Отправляется командой run_jobs.
+    """
+    STATUS_PENDING = "pending"
+    STATUS_SENT = "sent"
+    STATUS_FAILED = "failed"
+
+    subject = models.CharField(max_length=255)
+    message = models.TextField()
+    from_email = models.CharField(max_length=256)
+    recipients = models.JSONField()
+    status = models.CharField(max_length=10, default=STATUS_PENDING, choices=[
+        (STATUS_PENDING, "В очереди"),
+        (STATUS_SENT, "Отправлено"),
+        (STATUS_FAILED, "Ошибка"),
+    ])
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    claimed_by = models.CharField(max_length=32, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Письмо в очереди"
+        verbose_name_plural = "Очередь писем"
+        indexes = [models.Index(fields=["status", "run_at"])]
+
+    def __str__(self):
+        return f"{self.subject} -> {', '.join(self.recipients)}"
@@ -1,28 +1,79 @@
-# from django.core.mail import send_mail
-# from celery import shared_task
-
-# from backend.settings import EMAIL_HOST_USER
-
-
-# @shared_task()
-# def send_feedback_email_task(email, firs_name, last_name):
-#     """Sends an email when the feedback form has been submitted."""
-#     send_mail(
-#         "Your Feedback",
-#         f"\t{firs_name} {last_name}\n\nСпасибо за регистрацию!",
-#         EMAIL_HOST_USER,
-#         [email],
-#         fail_silently=False,
-#     )
-
-
-# @shared_task()
-# def send_feedback_email_task_update(email, firs_name, last_name):
-#     """Sends an email when the feedback form has been submitted."""
-#     send_mail(
-#         "Your Feedback",
-#         f"\t{firs_name} {last_name}\n\nВы изменили учётную запись!",
-#         EMAIL_HOST_USER,
-#         [email],
-#         fail_silently=False,
-#     )
+from datetime import timedelta
+from uuid import uuid4
+
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from authapp.models import EmailJob
+
+MAX_ATTEMPTS = 5
+RETRY_DELAY = timedelta(minutes=1)  # doubled after every failed attempt
+LEASE = timedelta(minutes=5)
+
+
+def send_mail_later(subject, message, from_email, recipient_list):
+    """
+    Постановка письма в очередь вместо синхронной отправки по SMTP.
+    """
+    return EmailJob.objects.create(
+        subject=subject, message=message, from_email=from_email, recipients=list(recipient_list)
+    )
+
+
+def claim_jobs(batch_size):
+    """
+    Захват пачки писем текущим обработчиком.
+    SELECT ... FOR UPDATE SKIP LOCKED там, где база это умеет; на SQLite
+    защитой служит условный UPDATE, который повторно проверяет, что письмо свободно.
+    """
+    now = timezone.now()
+    claimable = EmailJob.objects.filter(
+        Q(locked_until__isnull=True) | Q(locked_until__lt=now),
+        status=EmailJob.STATUS_PENDING, run_at__lte=now,
+    )
+    token = uuid4().hex
+    with transaction.atomic():
+        ids = list(
+            claimable.order_by("run_at", "pk").select_for_update(skip_locked=True).values_list("pk", flat=True)[
+                :batch_size
+            ]
+        )
+        claimable.filter(pk__in=ids).update(claimed_by=token, locked_until=now + LEASE)
+    return list(EmailJob.objects.filter(claimed_by=token, status=EmailJob.STATUS_PENDING).order_by("pk"))
+
+
+def run_email_jobs(batch_size=50):
+    """
+    Отправка пачки писем через одно SMTP-соединение.
+    Возвращает количество отправленных и неудачных писем.
+    """
+    jobs = claim_jobs(batch_size)
+    if not jobs:
+        return 0, 0
+
+    sent, failed = [], []
+    with get_connection() as connection:
+        for job in jobs:
+            try:
+                EmailMessage(job.subject, job.message, job.from_email, job.recipients, connection=connection).send()
+            except Exception as e:
+                failed.append((job, e))
+            else:
+                sent.append(job.pk)
+
+    now = timezone.now()
+    EmailJob.objects.filter(pk__in=sent).update(
+        status=EmailJob.STATUS_SENT, sent_at=now, attempts=F("attempts") + 1, locked_until=None
+    )
+    for job, error in failed:
+        attempts = job.attempts + 1
+        EmailJob.objects.filter(pk=job.pk).update(
+            status=EmailJob.STATUS_FAILED if attempts >= MAX_ATTEMPTS else EmailJob.STATUS_PENDING,
+            attempts=attempts,
+            run_at=now + RETRY_DELAY * 2 ** job.attempts,
+            locked_until=None,
+            last_error=str(error),
+        )
+    return len(sent), len(failed)
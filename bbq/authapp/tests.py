@@ -1,3 +1,106 @@
-from django.test import TestCase
+from io import StringIO
+from unittest.mock import patch
 
-# Create your tests here.
+from django.contrib.auth import authenticate
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.conf import settings
+from django.test import TestCase, override_settings
+from django.urls import path
+from django.utils import timezone
+
+from api.throttling import get_counter_store
+from authapp.backend import UserModelBackend
+from authapp.models import CustomUser, EmailJob
+from authapp.tasks import claim_jobs, run_email_jobs, send_mail_later, MAX_ATTEMPTS
+from authapp.views import CustomLoginView
+
+# authapp.urls is not mounted in bbq.urls, the login tests mount the view themselves
+urlpatterns = [path("login/", CustomLoginView.as_view())]
+
+
+class EmailJobTest(TestCase):
+    def enqueue(self, count=1):
+        for i in range(count):
+            send_mail_later(f"Письмо {i}", "Текст", "k2foxspb@mail.ru", [f"user{i}@example.com"])
+
+    def test_enqueue_does_not_send(self):
+        self.enqueue()
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(EmailJob.objects.get().status, EmailJob.STATUS_PENDING)
+
+    def test_run_jobs_sends_batch(self):
+        self.enqueue(3)
+        call_command("run_jobs", "--once", stdout=StringIO())
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox),
+                         ["user0@example.com", "user1@example.com", "user2@example.com"])
+        self.assertEqual(EmailJob.objects.filter(status=EmailJob.STATUS_SENT).count(), 3)
+
+    def test_claimed_jobs_are_skipped(self):
+        self.enqueue(2)
+        self.assertEqual(len(claim_jobs(1)), 1)
+        self.assertEqual(len(claim_jobs(10)), 1)
+        self.assertEqual(claim_jobs(10), [])
+
+    def test_failure_is_recorded_and_retried(self):
+        self.enqueue()
+        with patch("authapp.tasks.EmailMessage.send", side_effect=OSError("SMTP down")):
+            self.assertEqual(run_email_jobs(), (0, 1))
+        job = EmailJob.objects.get()
+        self.assertEqual((job.status, job.attempts, job.last_error), (EmailJob.STATUS_PENDING, 1, "SMTP down"))
+        self.assertGreater(job.run_at, timezone.now())
+
+        EmailJob.objects.update(run_at=timezone.now(), attempts=MAX_ATTEMPTS - 1)
+        with patch("authapp.tasks.EmailMessage.send", side_effect=OSError("SMTP down")):
+            run_email_jobs()
+        self.assertEqual(EmailJob.objects.get().status, EmailJob.STATUS_FAILED)
+
+
+class UserModelBackendTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user(email="Ivan@Example.com", username="ivan", password="secret")
+
+    def test_login_by_email_in_any_case_or_username(self):
+        self.assertEqual(authenticate(username="ivan@example.com", password="secret"), self.user)
+        self.assertEqual(authenticate(username="ivan", password="secret"), self.user)
+        self.assertIsNone(authenticate(username="IVAN@EXAMPLE.COM", password="wrong"))
+        self.assertIsNone(authenticate(username="nobody@example.com", password="secret"))
+
+    def test_exact_email_wins_and_password_is_checked(self):
+        other = CustomUser.objects.create_user(email="ivan@example.com", username="ivan2", password="other")
+        self.assertEqual(authenticate(username="ivan@example.com", password="other"), other)
+        self.assertIsNone(authenticate(username="ivan@example.com", password="secret"))
+
+    def test_get_user_is_cached_until_user_changes(self):
+        backend = UserModelBackend()
+        backend.get_user(self.user.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(backend.get_user(self.user.pk), self.user)
+        self.user.is_active = False
+        self.user.save()
+        self.assertIsNone(backend.get_user(self.user.pk))
+
+
+@override_settings(
+    ROOT_URLCONF="authapp.tests",
+    REST_FRAMEWORK={**settings.REST_FRAMEWORK, "DEFAULT_THROTTLE_RATES": {
+        **settings.REST_FRAMEWORK["DEFAULT_THROTTLE_RATES"], "token": "2/minute",
+    }},
+    API_THROTTLE_STORE="api.throttling.MemoryCounterStore",
+)
+class LoginThrottleTest(TestCase):
+    def setUp(self):
+        self.enterContext(patch("api.throttling.time", return_value=1_000_000.0))  # One fixed window
+
+    def tearDown(self):
+        get_counter_store().clear()
+
+    def test_password_form_is_limited(self):
+        CustomUser.objects.create_user(email="ivan@example.com", username="ivan", password="secret")
+        statuses = []
+        for _ in range(3):
+            statuses.append(self.client.post("/login/", {"username": "ivan", "password": "secret"}).status_code)
+            self.client.logout()  # Counted per IP and session like any guest
+        self.assertEqual(statuses, [302, 302, 429])
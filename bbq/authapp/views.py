@@ -4,6 +4,7 @@ from django.contrib.auth.mixins import UserPassesTestMixin
 from django.contrib.auth.views import LoginView, PasswordResetView, PasswordResetConfirmView, LogoutView
 from django.contrib.sites.models import Site
 from django.urls import reverse_lazy
+from django.utils.decorators import method_decorator
 from django.utils.safestring import mark_safe
 from django.views.generic import CreateView, UpdateView, View, TemplateView
 
@@ -11,11 +12,15 @@ from django.contrib.auth.tokens import default_token_generator
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from authapp import forms
 from django.utils.encoding import force_bytes
-from django.core.mail import send_mail
+from authapp.tasks import send_mail_later
 from django.shortcuts import redirect
 from django.contrib.messages.views import SuccessMessageMixin
 
+from api.throttling import throttle
 
+
+# Password attempts share the limit of /api/token/: switching between the site and the API gives no extra tries
+@method_decorator(throttle('token'), name='post')
 class CustomLoginView(SuccessMessageMixin, LoginView):
     template_name = "login.html"
 
@@ -58,7 +63,6 @@ class RegisterView(CreateView):
         return context
 
     def form_valid(self, form):
-        # form.send_email()
         user = form.save(commit=False)
         user.is_active = False
         user.save()
@@ -66,13 +70,11 @@ class RegisterView(CreateView):
         uid = urlsafe_base64_encode(force_bytes(user.pk))
         activation_url = reverse_lazy('authapp:conf_email', kwargs={'uidb64': uid, 'token': token})
         current_site = Site.objects.get_current().domain
-        send_mail(
+        send_mail_later(
             'Подтвердите свой электронный адрес',
             f'Пожалуйста перейдите по ссылке https://{current_site}{activation_url}',
             'k2foxspb@mail.ru',
             [user.email],
-            fail_silently=False,
-
         )
         return redirect('authapp:email_confirmation_sent')
 
@@ -95,13 +97,11 @@ class ProfileEditView(UserPassesTestMixin, UpdateView):
         uid = urlsafe_base64_encode(force_bytes(user.pk))
         activation_url = reverse_lazy('authapp:conf_email', kwargs={'uidb64': uid, 'token': token})
         current_site = Site.objects.get_current().domain
-        send_mail(
+        send_mail_later(
             'Подтвердите свой электронный адрес',
             f'Пожалуйста перейдите по ссылке https://{current_site}{activation_url}',
             'k2foxspb@mail.ru',
             [user.email],
-            fail_silently=False,
-
         )
         return redirect('authapp:email_confirmation_sent')
 
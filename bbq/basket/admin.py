@@ -1,18 +1,24 @@
 from django.contrib import admin
 
-from basket.models import Product, Order, Cart, CartItem, Category
+from basket.models import Product, Order, OrderItem, Cart, CartItem, Category
 
 
 # Register your models here.
 
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
-    search_fields = ('product',)
+    search_fields = ('name', 'description')
+
+
+class OrderItemInline(admin.TabularInline):
+    model = OrderItem
+    extra = 0
 
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
     search_fields = ('__all__',)
+    inlines = [OrderItemInline]
 
 
 @admin.register(Cart)
@@ -0,0 +1,322 @@
+from hashlib import sha256
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Subquery
+from django.utils.functional import cached_property
+
+from .catalog import get_catalog
+from .models import Cart, CartItem, Product
+
+
+class RequestCart:
+    """
+    Корзина текущего запроса.
+    Загружается лениво при первом обращении. Корзина гостя хранится
+    в сессии как {product_id: quantity} и не создаёт строк в базе.
+    """
+    session_key = 'cart'
+
+    def __init__(self, request):
+        self.request = request
+
+    @property
+    def is_guest(self):
+        return not self.request.user.is_authenticated
+
+    @property
+    def id(self):
+        return self.instance.pk if self.instance is not None else None
+
+    @property
+    def user(self):
+        return None if self.is_guest else self.request.user
+
+    @property
+    def created_at(self):
+        return self.instance.created_at if self.instance is not None else None
+
+    def queryset(self):
+        """
+        Корзины, доступные текущему пользователю.
+        """
+        if self.is_guest:
+            return Cart.objects.none()
+        return Cart.objects.filter(user=self.request.user)
+
+    def _session_items(self):
+        return self.request.session.get(self.session_key, {})
+
+    def _guest_items(self):
+        # Unsaved lines keyed by product id, products come from the catalog snapshot
+        session_items = self._session_items()
+        if not session_items:
+            return []
+        products = get_catalog().products_by_id
+        items = []
+        for product_id, quantity in session_items.items():
+            product = products.get(int(product_id))
+            if product is not None:
+                items.append(CartItem(pk=product.pk, product=product, quantity=quantity))
+        return items
+
+    @cached_property
+    def items(self):
+        """
+        Позиции корзины вместе с корзиной и продуктами одним запросом.
+        """
+        if self.is_guest:
+            return self._guest_items()
+        if 'instance' in self.__dict__:
+            if self.instance is None:
+                return []
+            return list(self.instance.items.select_related('product__category').order_by('pk'))
+        cart_id = self.queryset().order_by('pk').values('pk')[:1]
+        items = CartItem.objects.filter(cart_id=Subquery(cart_id))
+        return list(items.select_related('cart', 'product__category').order_by('pk'))
+
+    @cached_property
+    def instance(self):
+        if self.is_guest:
+            return None
+        if 'items' in self.__dict__ and self.items:
+            return self.items[0].cart
+        return self.queryset().order_by('pk').first()
+
+    @property
+    def count(self):
+        return sum(item.quantity for item in self.items)
+
+    @property
+    def total_price(self):
+        return sum(item.total_price for item in self.items)
+
+    def find_item(self, item_id):
+        """
+        Позиция по id: для гостя id позиции совпадает с id продукта.
+        """
+        return next((item for item in self.items if str(item.pk) == str(item_id)), None)
+
+    def get_or_create(self):
+        cart = self.instance
+        if cart is None and not self.is_guest:
+            # A concurrent request may have just created it: basket_cart_unique_user allows one
+            cart, _ = Cart.objects.get_or_create(user=self.request.user)
+            self.remember(cart)
+        return cart
+
+    def remember(self, cart):
+        """
+        Привязка корзины пользователя к текущему запросу.
+        """
+        self.refresh()
+        self.__dict__['instance'] = cart
+
+    def lock(self):
+        """
+        Блокировка строки корзины до конца транзакции и перечитывание позиций.
+        Для гостя блокируется строка его сессии, корзина перечитывается из неё.
+        """
+        if self.is_guest:
+            self._lock_session()
+        else:
+            carts = self.queryset().select_for_update()
+            if self.__dict__.get('instance') is not None:
+                carts = carts.filter(pk=self.instance.pk)
+            self.remember(carts.order_by('pk').first())
+        return self.items
+
+    def _lock_session(self):
+        # Parallel requests of one guest all loaded the same cart with the session;
+        # the one that waited for the lock sees what the first has already written
+        session = self.request.session
+        model = getattr(session, 'model', None)  # Only database sessions have a row to lock
+        if model is None or session.session_key is None:
+            return
+        row = model.objects.select_for_update().filter(session_key=session.session_key).first()
+        stored = session.decode(row.session_data) if row is not None else {}
+        if self.session_key in stored:
+            session[self.session_key] = stored[self.session_key]
+        else:
+            session.pop(self.session_key, None)
+        self.refresh()
+
+    def refresh(self):
+        """
+        Сброс загруженных позиций после изменения корзины.
+        """
+        self.__dict__.pop('items', None)
+
+    def _check_product(self, product_id):
+        if int(product_id) not in get_catalog().products_by_id:
+            raise Product.DoesNotExist(f"Product {product_id} does not exist")
+
+    def _update_session(self, product_id, quantity):
+        items = dict(self._session_items())
+        if quantity > 0:
+            items[str(product_id)] = quantity
+        else:
+            items.pop(str(product_id), None)
+        self.request.session[self.session_key] = items
+
+    def add(self, product_id, quantity=1):
+        self._check_product(product_id)
+        if self.is_guest:
+            self._update_session(product_id, self._session_items().get(str(product_id), 0) + quantity)
+        else:
+            cart = self.get_or_create()
+            cart_item, created = CartItem.objects.get_or_create(
+                cart=cart, product_id=product_id, defaults={'quantity': quantity}
+            )
+            if not created:
+                cart_item.quantity += quantity
+                cart_item.save()
+            cart.update_total_price()
+        self.refresh()
+
+    def set(self, product_id, quantity):
+        self._check_product(product_id)
+        if self.is_guest:
+            self._update_session(product_id, quantity)
+        else:
+            cart = self.get_or_create()
+            CartItem.objects.update_or_create(cart=cart, product_id=product_id, defaults={'quantity': quantity})
+            cart.update_total_price()
+        self.refresh()
+
+    def remove(self, product_id):
+        if self.is_guest:
+            self._update_session(product_id, 0)
+        elif self.instance is not None:
+            CartItem.objects.filter(cart=self.instance, product_id=product_id).delete()
+            self.instance.update_total_price()
+        self.refresh()
+
+    def apply(self, operations):
+        """
+        Несколько изменений корзины за раз: [(действие, product_id, количество)],
+        действия add, set и remove применяются по порядку.
+        Продукты проверяются по снимку каталога, позиции пишутся пакетными
+        запросами в одной транзакции, сумма пересчитывается один раз.
+        """
+        products = get_catalog().products_by_id
+        missing = [product_id for action, product_id, quantity in operations
+                   if action != 'remove' and product_id not in products]
+        if missing:
+            raise Product.DoesNotExist(f"Products {missing} do not exist")
+
+        if self.is_guest:
+            quantities = {int(product_id): quantity for product_id, quantity in self._session_items().items()}
+            _apply_operations(quantities, operations)
+            self.request.session[self.session_key] = {
+                str(product_id): quantity for product_id, quantity in quantities.items()
+            }
+            self.refresh()
+            return
+
+        with transaction.atomic():
+            self.get_or_create()
+            items = {item.product_id: item for item in self.lock()}
+            cart = self.instance
+            quantities = {product_id: item.quantity for product_id, item in items.items()}
+            _apply_operations(quantities, operations)
+
+            CartItem.objects.bulk_create(
+                CartItem(cart=cart, product_id=product_id, quantity=quantity)
+                for product_id, quantity in quantities.items() if product_id not in items
+            )
+            changed = []
+            for product_id, item in items.items():
+                if product_id in quantities and quantities[product_id] != item.quantity:
+                    item.quantity = quantities[product_id]
+                    changed.append(item)
+            if changed:
+                CartItem.objects.bulk_update(changed, ['quantity'])
+            removed = [product_id for product_id in items if product_id not in quantities]
+            if removed:
+                CartItem.objects.filter(cart=cart, product_id__in=removed).delete()
+            cart.update_total_price()
+        self.refresh()
+
+    def clear(self):
+        """
+        Удаление корзины после оформления заказа.
+        """
+        if self.instance is not None:
+            self.instance.delete()
+        self.request.session.pop(self.session_key, None)
+        if self.is_guest and self.request.session.session_key is not None:
+            self.request.session.save()  # In the checkout transaction, under the lock taken by lock()
+        self.refresh()
+        self.__dict__['instance'] = None
+
+
+def _apply_operations(quantities, operations):
+    # quantities: {product_id: quantity}, changed in place
+    for action, product_id, quantity in operations:
+        if action == 'add':
+            quantities[product_id] = quantities.get(product_id, 0) + quantity
+        elif action == 'set':
+            quantities[product_id] = quantity
+        else:
+            quantities.pop(product_id, None)
+
+
+def _upsert_items(cart, rows):
+    """
+    Добавление количеств [(product_id, quantity)] к строкам корзины.
+    SQLite и PostgreSQL: один INSERT ... ON CONFLICT по basket_cartitem_unique_product,
+    остальные базы: под блокировкой корзины пакетными запросами.
+    """
+    if connection.vendor in ('sqlite', 'postgresql'):
+        quote = connection.ops.quote_name
+        table = quote(CartItem._meta.db_table)
+        values = ', '.join(['(%s, %s, %s)'] * len(rows))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} ({quote("cart_id")}, {quote("product_id")}, {quote("quantity")}) '
+                f'VALUES {values} ON CONFLICT ({quote("cart_id")}, {quote("product_id")}) '
+                f'DO UPDATE SET {quote("quantity")} = {table}.{quote("quantity")} + excluded.{quote("quantity")}',
+                [value for product_id, quantity in rows for value in (cart.pk, product_id, quantity)],
+            )
+        return
+    Cart.objects.select_for_update().filter(pk=cart.pk).first()
+    existing = {item.product_id: item for item in CartItem.objects.filter(cart=cart)}
+    for product_id, quantity in rows:
+        if product_id in existing:
+            existing[product_id].quantity += quantity
+    CartItem.objects.bulk_update([existing[product_id] for product_id, _ in rows if product_id in existing],
+                                 ['quantity'])
+    CartItem.objects.bulk_create(CartItem(cart=cart, product_id=product_id, quantity=quantity)
+                                 for product_id, quantity in rows if product_id not in existing)
+
+
+def merge_guest_cart(request, user):
+    """
+    Перенос гостевой корзины из сессии в корзину пользователя при входе:
+    количества складываются одним upsert, итог пересчитывается один раз.
+    Строка корзины пользователя блокируется, в ней запоминается хэш гостевой сессии,
+    поэтому два входа с одной гостевой сессией (две вкладки, разные процессы)
+    переносят её один раз. Корзина убирается из сессии в той же транзакции.
+    """
+    items = request.session.get(RequestCart.session_key)
+    if not items:
+        return
+    products = get_catalog().products_by_id
+    rows = [(int(product_id), quantity) for product_id, quantity in items.items()
+            if int(product_id) in products and quantity > 0]
+    # Both tabs send the same guest session cookie; login() has already copied the session under a new key
+    guest_key = request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    marker = sha256(guest_key.encode()).hexdigest() if guest_key else ''
+    with transaction.atomic():
+        cart, _ = Cart.objects.get_or_create(user=user)  # basket_cart_unique_user settles concurrent creation
+        cart = Cart.objects.select_for_update().get(pk=cart.pk)
+        if rows and not (marker and cart.merged_session == marker):
+            _upsert_items(cart, rows)
+            Cart.objects.filter(pk=cart.pk).update(merged_session=marker)
+            cart.update_total_price()
+        request.session.pop(RequestCart.session_key, None)
+        if request.session.session_key is not None:
+            request.session.save()
+    if hasattr(request, 'cart'):
+        request.cart.remember(cart)
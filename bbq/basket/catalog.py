@@ -0,0 +1,96 @@
+from threading import Lock
+from types import MappingProxyType
+
+from django.db.models import F
+from django.db.models.functions import Now
+
+from .models import Category, Product, CatalogVersion
+
+CATALOG_VERSION_PK = 1
+
+_lock = Lock()
+_snapshot = None
+
+
+class CatalogSnapshot:
+    """
+    Неизменяемый снимок каталога: категории по slug, продукты по id
+    и продукты, сгруппированные по категориям.
+    """
+    __slots__ = ('version', 'categories', 'products', 'categories_by_slug', 'products_by_id',
+                 'products_by_category')
+
+    def __init__(self, version, categories, products):
+        categories_by_id = {category.pk: category for category in categories}
+        grouped = {category: [] for category in categories}
+        for product in products:
+            category = categories_by_id.get(product.category_id)
+            if category is not None:
+                product.category = category
+                grouped[category].append(product)
+
+        set_attr = super().__setattr__
+        set_attr('version', version)
+        set_attr('categories', tuple(categories))
+        set_attr('products', tuple(products))
+        set_attr('categories_by_slug', MappingProxyType({category.slug: category for category in categories}))
+        set_attr('products_by_id', MappingProxyType({product.pk: product for product in products}))
+        set_attr('products_by_category', MappingProxyType(
+            {category: tuple(products_in_category) for category, products_in_category in grouped.items()}
+        ))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('CatalogSnapshot is immutable')
+
+
+def get_catalog_version():
+    version = CatalogVersion.objects.filter(pk=CATALOG_VERSION_PK).values_list('version', flat=True).first()
+    return version or 0
+
+
+def get_catalog_state():
+    """
+    Версия каталога и время её изменения одним запросом по первичному ключу.
+    """
+    state = CatalogVersion.objects.filter(pk=CATALOG_VERSION_PK).values_list('version', 'updated_at').first()
+    return state or (0, None)
+
+
+def bump_catalog_version():
+    """
+    Увеличение общей версии каталога и сброс снимка текущего процесса.
+    Остальные процессы перестроят свой снимок, увидев новую версию.
+    """
+    global _snapshot
+    _snapshot = None
+    updated = CatalogVersion.objects.filter(pk=CATALOG_VERSION_PK).update(version=F('version') + 1, updated_at=Now())
+    if not updated:
+        CatalogVersion.objects.get_or_create(pk=CATALOG_VERSION_PK, defaults={'version': 1})
+
+
+def load_catalog(version=None):
+    """
+    Построение снимка каталога из базы: два запроса
+    независимо от количества категорий.
+    """
+    if version is None:
+        version = get_catalog_version()
+    return CatalogSnapshot(version, list(Category.objects.all()), list(Product.objects.all()))
+
+
+def get_catalog(version=None):
+    """
+    Снимок каталога текущего процесса.
+    Перестраивается только при смене общей версии каталога.
+    Уже прочитанную в этом запросе версию можно передать, чтобы не читать её повторно.
+    """
+    global _snapshot
+    if version is None:
+        version = get_catalog_version()
+    snapshot = _snapshot
+    if snapshot is not None and snapshot.version == version:
+        return snapshot
+    with _lock:
+        if _snapshot is None or _snapshot.version != version:
+            _snapshot = load_catalog(version)
+        return _snapshot
@@ -0,0 +1,68 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime, timedelta
+
+from django.utils import timezone
+
+from .models import CatalogTombstone, Category, Product
+
+# Новый токен отстаёт от текущего времени: строка, сохранённая с updated_at раньше токена,
+# но закоммиченная позже (долгая транзакция), всё равно попадёт в следующую выборку.
+# Повторно присланные изменения клиент просто применяет ещё раз.
+CHANGES_OVERLAP = timedelta(minutes=1)
+# Сколько хранятся отметки об удалении; клиент с более старым токеном загружает каталог заново
+TOMBSTONE_RETENTION = timedelta(days=30)
+
+TOMBSTONE_MODELS = {Category: 'category', Product: 'product'}
+
+
+def encode_token(moment):
+    return urlsafe_b64encode(moment.isoformat().encode()).decode().rstrip('=')
+
+
+def decode_token(token):
+    """
+    Время из токена синхронизации. ValueError, если токен испорчен.
+    """
+    try:
+        moment = datetime.fromisoformat(urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode())
+    except (TypeError, UnicodeDecodeError, ValueError) as e:
+        raise ValueError('Invalid sync token') from e
+    if timezone.is_naive(moment):
+        raise ValueError('Invalid sync token')
+    return moment
+
+
+def record_deletion(instance):
+    """
+    Отметка об удалении объекта каталога, заодно удаляются устаревшие отметки.
+    """
+    now = timezone.now()
+    CatalogTombstone.objects.filter(deleted_at__lt=now - TOMBSTONE_RETENTION).delete()
+    CatalogTombstone.objects.create(model=TOMBSTONE_MODELS[type(instance)], object_id=instance.pk, deleted_at=now)
+
+
+def catalog_changes(since=None):
+    """
+    Изменения каталога после момента since: изменённые и новые категории и продукты
+    (QuerySet'ы по индексу updated_at), id удалённых и токен для следующего запроса.
+    Без since или со слишком старым since возвращается весь каталог и reset=True —
+    клиент должен заменить свою копию целиком.
+    """
+    now = timezone.now()
+    reset = since is None or since < now - TOMBSTONE_RETENTION
+    categories = Category.objects.order_by('pk')
+    products = Product.objects.order_by('pk')
+    deleted = {'categories': [], 'products': []}
+    if not reset:
+        categories = categories.filter(updated_at__gt=since)
+        products = products.filter(updated_at__gt=since)
+        tombstones = CatalogTombstone.objects.filter(deleted_at__gt=since).order_by('pk')
+        for model, object_id in tombstones.values_list('model', 'object_id'):
+            deleted['categories' if model == 'category' else 'products'].append(object_id)
+    return {
+        'token': encode_token(now - CHANGES_OVERLAP),
+        'reset': reset,
+        'categories': categories,
+        'products': products,
+        'deleted': deleted,
+    }
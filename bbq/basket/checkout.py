@@ -0,0 +1,85 @@
+from hashlib import sha256
+
+from django.db import IntegrityError, transaction
+
+from .models import Order
+from .telegram import format_order_message, send_message
+
+
+class EmptyCartError(Exception):
+    pass
+
+
+class IdempotencyKeyReused(Exception):
+    """
+    Ключ идемпотентности уже использован другим покупателем.
+    """
+
+
+def get_order_owner(request):
+    """
+    Владелец ключа идемпотентности: пользователь или сессия гостя.
+    Ключ сессии хранится в заказе только хэшем. None для гостя без сессии.
+    """
+    if request.user.is_authenticated:
+        return f'user:{request.user.pk}'
+    session_key = request.session.session_key
+    if session_key is None:
+        return None
+    return f'session:{sha256(session_key.encode()).hexdigest()}'
+
+
+def find_order(request, idempotency_key):
+    """
+    Заказ, уже оформленный этим покупателем с этим ключом, или None.
+    IdempotencyKeyReused, если ключ занят заказом другого покупателя.
+    """
+    if not idempotency_key:
+        return None
+    owner = get_order_owner(request)
+    orders = list(Order.objects.filter(idempotency_key=idempotency_key))
+    for order in orders:
+        if owner is not None and order.idempotency_owner == owner:
+            return order
+    if orders:
+        raise IdempotencyKeyReused
+    return None
+
+
+def place_order(request, order, idempotency_key=None):
+    """
+    Оформление заказа из корзины запроса одной транзакцией.
+    Строка корзины (у гостя — строка сессии) блокируется до конца транзакции,
+    поэтому параллельные запросы не создадут второй заказ. Повтор с тем же ключом идемпотентности возвращает
+    исходный заказ, ключ другого покупателя — IdempotencyKeyReused.
+    Возвращает пару (заказ, создан ли он сейчас).
+    """
+    idempotency_key = idempotency_key or None
+    existing = find_order(request, idempotency_key)
+    if existing is not None:
+        return existing, False
+
+    cart = request.cart
+    try:
+        with transaction.atomic():
+            items = cart.lock()
+            if not items:
+                raise EmptyCartError
+            order.user = cart.user
+            order.idempotency_key = idempotency_key
+            if idempotency_key:
+                order.idempotency_owner = get_order_owner(request) or ''
+            order.products = Order.describe_items(items)  # Display copy of the order items
+            order.total_price = cart.total_price
+            order.save()
+            order.add_items(items)
+            # The notification is queued in the same transaction as the order
+            send_message(format_order_message(order))
+            cart.clear()
+    except (EmptyCartError, IntegrityError):
+        # A concurrent request with the same key may have won the race
+        existing = find_order(request, idempotency_key)
+        if existing is None:
+            raise
+        return existing, False
+    return order, True
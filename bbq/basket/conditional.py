@@ -0,0 +1,52 @@
+from hashlib import sha1
+
+from django.contrib.messages import get_messages
+from django.views.decorators.http import condition
+
+from .catalog import get_catalog_state
+
+
+def catalog_state(request):
+    """
+    Версия каталога, прочитанная один раз за запрос: её используют и ETag, и Last-Modified.
+    """
+    state = getattr(request, '_catalog_state', None)
+    if state is None:
+        state = request._catalog_state = get_catalog_state()
+    return state
+
+
+def _digest(*parts):
+    return sha1('|'.join(str(part) for part in parts).encode()).hexdigest()[:16]
+
+
+def catalog_etag(request, *args, **kwargs):
+    """
+    ETag ответов API: версия каталога и формат ответа (JSON или browsable API).
+    """
+    version, _ = catalog_state(request)
+    return f'"catalog-{version}-{_digest(request.META.get("HTTP_ACCEPT", ""))}"'
+
+
+def catalog_last_modified(request, *args, **kwargs):
+    return catalog_state(request)[1]
+
+
+def page_etag(request, *args, **kwargs):
+    """
+    ETag HTML-страниц каталога. Кроме версии каталога страница зависит от
+    посетителя: пользователя, CSRF-токена в формах и количества товаров в корзине.
+    """
+    if len(get_messages(request)):
+        return None  # Pending messages are shown once, the page must be rendered
+    version, _ = catalog_state(request)
+    visitor = _digest(
+        request.user.pk, request.META.get('CSRF_COOKIE', ''), request.cart.count,
+    )
+    return f'"page-{version}-{visitor}"'
+
+
+# Ответ 304 отдаётся до сериализации и рендеринга шаблона
+catalog_condition = condition(etag_func=catalog_etag, last_modified_func=catalog_last_modified)
+# Last-Modified не подходит страницам: они меняются вместе с корзиной, а не только с каталогом
+page_condition = condition(etag_func=page_etag)
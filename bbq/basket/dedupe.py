@@ -0,0 +1,57 @@
+from django.db import transaction
+from django.db.models import Count, DecimalField, Exists, F, Min, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def merge_duplicate_carts(Cart, CartItem, batch_size=500):
+    """
+    Слияние дублей перед ограничениями уникальности корзин:
+    все корзины пользователя сливаются в самую старую, одинаковые продукты
+    в корзине — в одну строку с суммой количеств, итоги пересчитываются.
+    Модели передаются явно, чтобы функцию можно было вызвать из миграции.
+    Возвращает количество удалённых корзин и строк.
+    """
+    carts_merged = items_merged = 0
+    touched = set()
+
+    duplicate_users = (Cart.objects.filter(user__isnull=False).values('user')
+                       .annotate(count=Count('pk'), keep=Min('pk')).filter(count__gt=1).order_by('user'))
+    while True:
+        groups = list(duplicate_users[:batch_size])
+        if not groups:
+            break
+        with transaction.atomic():
+            keep = {group['user']: group['keep'] for group in groups}
+            extra = list(Cart.objects.filter(user__in=keep).exclude(pk__in=keep.values()).values_list('pk', 'user'))
+            for user, keep_id in keep.items():
+                moved = [pk for pk, owner in extra if owner == user]
+                CartItem.objects.filter(cart_id__in=moved).update(cart_id=keep_id)
+            Cart.objects.filter(pk__in=[pk for pk, owner in extra]).delete()
+        carts_merged += len(extra)
+        touched.update(keep.values())
+
+    duplicate_items = (CartItem.objects.values('cart', 'product')
+                       .annotate(count=Count('pk'), keep=Min('pk'), total=Sum('quantity'))
+                       .filter(count__gt=1).order_by('cart', 'product'))
+    while True:
+        groups = list(duplicate_items[:batch_size])
+        if not groups:
+            break
+        with transaction.atomic():
+            CartItem.objects.bulk_update(
+                [CartItem(pk=group['keep'], quantity=group['total']) for group in groups], ['quantity']
+            )
+            older = CartItem.objects.filter(cart=OuterRef('cart'), product=OuterRef('product'), pk__lt=OuterRef('pk'))
+            carts = {group['cart'] for group in groups}
+            items_merged += CartItem.objects.filter(cart_id__in=carts).filter(Exists(older)).delete()[0]
+        touched.update(carts)
+
+    total = CartItem.objects.filter(cart=OuterRef('pk')).values('cart').annotate(
+        total=Sum(F('product__price') * F('quantity'))
+    ).values('total')
+    touched = sorted(touched)
+    for start in range(0, len(touched), batch_size):
+        Cart.objects.filter(pk__in=touched[start:start + batch_size]).update(
+            total_price=Coalesce(Subquery(total), Value(0), output_field=DecimalField(max_digits=10, decimal_places=2))
+        )
+    return carts_merged, items_merged
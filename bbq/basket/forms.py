@@ -1,23 +1,24 @@
 from django import forms
 from phonenumber_field.formfields import PhoneNumberField
 from .models import Order
-import phonenumbers  # Import phonenumbers here
+from .phones import normalize_phone
 
 class OrderForm(forms.ModelForm):
     # name = forms.CharField(widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Имя'}))
     shipping_address = forms.CharField(max_length=255, required=True, widget=forms.TextInput(attrs={'placeholder': 'Адрес доставки'}))
     phone_number = PhoneNumberField(region="RU")
     message = forms.CharField(widget=forms.Textarea(attrs={'placeholder': 'Дополнительная информация'}), required=False)
+    # Generated when the form is shown, a repeated submit carries the same key
+    idempotency_key = forms.CharField(max_length=64, required=False, widget=forms.HiddenInput())
 
     def clean_phone_number(self):
         phone = self.cleaned_data.get('phone_number')
         if not phone:
             raise forms.ValidationError("Пожалуйста, введите номер телефона.")
-        try:
-            phonenumbers.parse(str(phone), None)  # Validate the number
-            return phone
-        except phonenumbers.phonenumberutil.NumberParseException as e:
-            raise forms.ValidationError(f"Неверный формат номера телефона: {e}")
+        normalized = normalize_phone(phone)  # Stored as E.164, the same form guests search by
+        if normalized is None:
+            raise forms.ValidationError("Неверный формат номера телефона.")
+        return normalized
 
     class Meta:
         model = Order
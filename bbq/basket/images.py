@@ -0,0 +1,150 @@
+import os
+from base64 import b64encode
+from concurrent.futures import as_completed
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.utils import timezone
+
+from authapp.backend import forget_user
+from authapp.models import CustomUser
+from .catalog import bump_catalog_version
+from .models import Product
+from .thumbnails import generate_thumbnails
+
+# Модель, поле с картинкой и максимальный размер после нормализации
+IMAGE_FIELDS = [
+    (Product, 'image', (2000, 2000)),
+    (CustomUser, 'avatar', (512, 512)),
+]
+JPEG_QUALITY = 85
+PLACEHOLDER_SIZE = (16, 16)
+
+
+def normalize_image(data, max_size):
+    """
+    Нормализация загруженной картинки, выполняется в процессе из пула.
+    Поворот по EXIF применяется к пикселям, после чего метаданные отбрасываются;
+    размер ограничивается max_size, картинка перекодируется в JPEG
+    (или PNG, если у неё есть прозрачность). Возвращает словарь с новым файлом,
+    его размерами и размытым превью 16 px в виде data: URI.
+    """
+    from PIL import Image, ImageFilter, ImageOps
+
+    with Image.open(BytesIO(data)) as source:
+        image = ImageOps.exif_transpose(source)
+    image.thumbnail(max_size, Image.Resampling.LANCZOS)
+
+    transparent = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+    output = BytesIO()
+    if transparent:
+        image = image.convert('RGBA')
+        image.save(output, 'PNG', optimize=True)
+        extension = 'png'
+    else:
+        image = image.convert('RGB')
+        image.save(output, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+        extension = 'jpg'
+
+    placeholder = image.convert('RGB')
+    placeholder.thumbnail(PLACEHOLDER_SIZE)
+    preview = BytesIO()
+    placeholder.filter(ImageFilter.GaussianBlur(1)).save(preview, 'JPEG', quality=40)
+
+    return {
+        'content': output.getvalue(),
+        'extension': extension,
+        'width': image.width,
+        'height': image.height,
+        'placeholder': 'data:image/jpeg;base64,' + b64encode(preview.getvalue()).decode(),
+    }
+
+
+def mark_unprocessed(instance, field):
+    """
+    Новый загруженный файл снова ставится в очередь обработки (вызывается из pre_save).
+    """
+    fieldfile = getattr(instance, field)
+    if fieldfile and not fieldfile._committed:
+        setattr(instance, f'{field}_width', None)
+        setattr(instance, f'{field}_height', None)
+        setattr(instance, f'{field}_placeholder', '')
+        setattr(instance, f'{field}_processed_at', None)
+        setattr(instance, f'{field}_failed_at', None)
+
+
+def pending_images(model, field):
+    return model.objects.filter(**{f'{field}_processed_at__isnull': True, f'{field}_failed_at__isnull': True}).exclude(
+        **{f'{field}__isnull': True}).exclude(**{field: ''})
+
+
+def process_images(executor, batch_size=20, log=None):
+    """
+    Обработка пачки необработанных картинок всех моделей из IMAGE_FIELDS.
+    Pillow работает в процессах executor, здесь только чтение и запись файлов.
+    Файл, которого нет или который Pillow не читает, помечается {field}_failed_at
+    и больше не обрабатывается; прочие ошибки ввода-вывода повторяются в следующий проход.
+    Возвращает количество обработанных и неудачных картинок.
+    """
+    log = log or (lambda message: None)
+    processed = failed = 0
+    for model, field, max_size in IMAGE_FIELDS:
+        storage = model._meta.get_field(field).storage
+        futures = {}
+        for pk, name in pending_images(model, field).order_by('pk').values_list('pk', field)[:batch_size]:
+            try:
+                with storage.open(name) as file:
+                    data = file.read()
+            except FileNotFoundError as e:
+                _mark_failed(model, field, pk, name)
+                log(f"{name}: {e}")
+                failed += 1
+                continue
+            except OSError as e:
+                # Storage unavailable for now: the image stays in the queue
+                log(f"{name}: {e}")
+                failed += 1
+                continue
+            futures[executor.submit(normalize_image, data, max_size)] = (pk, name)
+
+        changed = []
+        for future in as_completed(futures):
+            pk, name = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                # Not an image Pillow can read: don't retry it on every run
+                _mark_failed(model, field, pk, name)
+                log(f"{name}: {e}")
+                failed += 1
+                continue
+            new_name = storage.save(f'{os.path.splitext(name)[0]}.{result["extension"]}',
+                                    ContentFile(result['content']))
+            # The photo may have been replaced while it was processed
+            changes = {'updated_at': timezone.now()} if hasattr(model, 'updated_at') else {}
+            updated = model.objects.filter(pk=pk, **{field: name}).update(**changes, **{
+                field: new_name,
+                f'{field}_width': result['width'],
+                f'{field}_height': result['height'],
+                f'{field}_placeholder': result['placeholder'],
+                f'{field}_processed_at': timezone.now(),
+            })
+            if not updated:
+                storage.delete(new_name)
+                continue
+            storage.delete(name)
+            if model is CustomUser:
+                forget_user(pk)  # update() sends no post_save
+            changed.append(new_name)
+            processed += 1
+
+        if model is Product and changed:
+            for name in changed:
+                generate_thumbnails(name)
+            bump_catalog_version()
+    return processed, failed
+
+
+def _mark_failed(model, field, pk, name):
+    # Not marked processed: there are no thumbnails, pages keep showing the original
+    model.objects.filter(pk=pk, **{field: name}).update(**{f'{field}_failed_at': timezone.now()})
@@ -0,0 +1,61 @@
+import os
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from easy_thumbnails.models import Source
+
+from basket.images import IMAGE_FIELDS
+
+
+class Command(BaseCommand):
+    help = "Удаление файлов в MEDIA_ROOT, на которые не ссылается ни одна запись, вместе с их миниатюрами"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-age-hours', type=float, default=24,
+                            help="Не трогать файлы моложе этого возраста: их запись может быть ещё не сохранена")
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help="Количество файлов, удаляемых за один проход")
+        parser.add_argument('--dry-run', action='store_true', help="Только показать, что будет удалено")
+
+    def handle(self, *args, min_age_hours, batch_size, dry_run, **options):
+        storage = IMAGE_FIELDS[0][0]._meta.get_field(IMAGE_FIELDS[0][1]).storage
+        referenced = set()
+        for model, field, _ in IMAGE_FIELDS:
+            referenced.update(model.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True})
+                              .values_list(field, flat=True).iterator())
+
+        cutoff = timezone.now() - timedelta(hours=min_age_hours)
+        orphans = [name for name in self.walk(storage, '')
+                   if not self.is_referenced(name, referenced) and storage.get_modified_time(name) < cutoff]
+
+        for start in range(0, len(orphans), batch_size):
+            batch = orphans[start:start + batch_size]
+            if dry_run:
+                self.stdout.write('\n'.join(batch))
+                continue
+            for name in batch:
+                storage.delete(name)
+            # Thumbnail cache rows of deleted sources
+            Source.objects.filter(name__in=batch).delete()
+        verb = "Будет удалено" if dry_run else "Удалено"
+        self.stdout.write(self.style.SUCCESS(f"{verb} файлов: {len(orphans)}"))
+
+    def walk(self, storage, path):
+        try:
+            directories, files = storage.listdir(path)
+        except FileNotFoundError:
+            return
+        for name in files:
+            yield os.path.join(path, name) if path else name
+        for directory in directories:
+            yield from self.walk(storage, os.path.join(path, directory) if path else directory)
+
+    @staticmethod
+    def is_referenced(name, referenced):
+        # Thumbnails are stored next to the source as "<source>.<options>.<ext>"
+        while name:
+            if name in referenced:
+                return True
+            name, dot, _ = name.rpartition('.')
+        return False
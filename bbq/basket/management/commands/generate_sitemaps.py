@@ -0,0 +1,17 @@
+from time import monotonic
+
+from django.core.management.base import BaseCommand
+
+from bbq.sitemaps import generate_sitemaps
+
+
+class Command(BaseCommand):
+    help = "Генерация карты сайта в SITEMAP_ROOT (обычно она перестраивается сама при изменении каталога)"
+
+    def handle(self, *args, **options):
+        started = monotonic()
+        directory = generate_sitemaps()
+        files = sorted(path.name for path in directory.iterdir())
+        self.stdout.write(self.style.SUCCESS(
+            f"Карта сайта: {len(files)} файлов в {directory} за {monotonic() - started:.2f} с"
+        ))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from basket.models import Product
+from basket.thumbnails import generate_thumbnails
+
+
+class Command(BaseCommand):
+    help = "Создание миниатюр для всех фотографий продуктов (для фото, загруженных до появления миниатюр)"
+
+    def handle(self, *args, **options):
+        generated = failed = 0
+        for name in Product.objects.exclude(image='').exclude(image__isnull=True).values_list('image', flat=True):
+            try:
+                generate_thumbnails(name)
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f"{name}: {e}")
+            else:
+                generated += 1
+        self.stdout.write(self.style.SUCCESS(f"Обработано фотографий: {generated}, с ошибками: {failed}"))
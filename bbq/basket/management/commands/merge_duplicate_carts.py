@@ -0,0 +1,22 @@
+from time import monotonic
+
+from django.core.management.base import BaseCommand
+
+from basket.dedupe import merge_duplicate_carts
+from basket.models import Cart, CartItem
+
+
+class Command(BaseCommand):
+    help = ("Слияние повторных корзин пользователя и повторных строк продукта в корзине "
+            "(запускается перед миграцией с ограничениями уникальности)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help="Количество пользователей или пар корзина-продукт за одну транзакцию")
+
+    def handle(self, *args, batch_size, **options):
+        started = monotonic()
+        carts, items = merge_duplicate_carts(Cart, CartItem, batch_size)
+        self.stdout.write(self.style.SUCCESS(
+            f"Слито корзин: {carts}, строк: {items} за {monotonic() - started:.2f} с"
+        ))
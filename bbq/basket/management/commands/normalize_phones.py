@@ -0,0 +1,46 @@
+from time import monotonic, sleep
+
+from django.core.management.base import BaseCommand
+
+from basket.models import Order
+from basket.phones import normalize_phone
+
+
+class Command(BaseCommand):
+    help = "Приведение телефонов в старых заказах к E.164 небольшими пачками"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help="Количество заказов, читаемых и обновляемых за раз")
+        parser.add_argument('--sleep', dest='pause_seconds', type=float, default=0,
+                            help="Пауза в секундах между пачками, чтобы не мешать живому трафику")
+
+    def handle(self, *args, batch_size, pause_seconds, **options):
+        orders = Order.objects.exclude(phone_number__isnull=True).exclude(phone_number='').order_by('pk')
+        started = monotonic()
+        last_pk = 0
+        checked = updated = invalid = 0
+
+        while True:
+            batch = list(orders.filter(pk__gt=last_pk).only('pk', 'phone_number')[:batch_size])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+            changed = []
+            for order in batch:
+                normalized = normalize_phone(order.phone_number)
+                if normalized is None:
+                    invalid += 1  # Left as is: a manager can still find it in the admin
+                elif normalized != order.phone_number:
+                    order.phone_number = normalized
+                    changed.append(order)
+            Order.objects.bulk_update(changed, ['phone_number'])
+            checked += len(batch)
+            updated += len(changed)
+            if pause_seconds:
+                sleep(pause_seconds)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Проверено заказов: {checked}, исправлено: {updated}, не распознано: {invalid} "
+            f"за {monotonic() - started:.2f} с"
+        ))
@@ -0,0 +1,28 @@
+from concurrent.futures import ProcessPoolExecutor
+from time import sleep
+
+from django.core.management.base import BaseCommand
+
+from basket.images import process_images
+
+
+class Command(BaseCommand):
+    help = "Нормализация загруженных фото продуктов и аватаров в пуле процессов"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Обработать очередь один раз и выйти")
+        parser.add_argument("--interval", type=float, default=5, help="Пауза между проверками очереди, с")
+        parser.add_argument("--batch-size", type=int, default=20, help="Картинок одной модели за проход")
+        parser.add_argument("--workers", type=int, default=None, help="Процессов Pillow (по умолчанию по числу CPU)")
+
+    def handle(self, *args, once, interval, batch_size, workers, **options):
+        # Worker processes only run Pillow on bytes, all database and storage access stays here
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            while True:
+                processed, failed = process_images(executor, batch_size, log=self.stderr.write)
+                if processed or failed:
+                    self.stdout.write(f"Обработано: {processed}, ошибок: {failed}")
+                if once:
+                    break
+                if not processed:
+                    sleep(interval)  # Also when storage errors left images in the queue
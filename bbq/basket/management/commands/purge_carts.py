@@ -0,0 +1,58 @@
+from datetime import timedelta
+from time import monotonic, sleep
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from basket.models import Cart, CartItem
+
+
+class Command(BaseCommand):
+    help = "Удаление заброшенных гостевых корзин и позиций без корзины небольшими пачками"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ttl-days', type=int, default=getattr(settings, 'CART_TTL_DAYS', 30),
+                            help="Через сколько дней без изменений гостевая корзина считается заброшенной")
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help="Количество корзин, удаляемых одной транзакцией")
+        parser.add_argument('--sleep', dest='pause_seconds', type=float, default=0,
+                            help="Пауза в секундах между пачками, чтобы не мешать живому трафику")
+
+    def handle(self, *args, ttl_days, batch_size, pause_seconds, **options):
+        cutoff = timezone.now() - timedelta(days=ttl_days)
+        abandoned = Cart.objects.filter(user__isnull=True, created_at__lt=cutoff, updated_at__lt=cutoff)
+        started = monotonic()
+        carts_deleted = items_deleted = 0
+
+        while True:
+            ids = list(abandoned.order_by('pk').values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                break
+            with transaction.atomic():
+                # Re-check the cutoff so a cart touched since the select survives
+                _, deleted = abandoned.filter(pk__in=ids).delete()
+            carts_deleted += deleted.get(Cart._meta.label, 0)
+            items_deleted += deleted.get(CartItem._meta.label, 0)
+            self.pause(pause_seconds)
+
+        orphaned = CartItem.objects.filter(~Exists(Cart.objects.filter(pk=OuterRef('cart_id'))))
+        while True:
+            ids = list(orphaned.order_by('pk').values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                break
+            items_deleted += CartItem.objects.filter(pk__in=ids).delete()[0]
+            self.pause(pause_seconds)
+
+        elapsed = monotonic() - started
+        rate = (carts_deleted + items_deleted) / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Удалено корзин: {carts_deleted}, позиций: {items_deleted} за {elapsed:.2f} с ({rate:.0f} строк/с)"
+        ))
+
+    @staticmethod
+    def pause(seconds):
+        if seconds:
+            sleep(seconds)
@@ -0,0 +1,22 @@
+from time import monotonic
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from basket.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = "Полная перестройка поискового индекса продуктов (после migrate, bulk_create, импорта, восстановления базы или изменения стеммера)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help="Количество продуктов, индексируемых за один запрос")
+
+    def handle(self, *args, batch_size, **options):
+        started = monotonic()
+        with transaction.atomic():
+            count = get_search_backend().rebuild(batch_size=batch_size)
+        self.stdout.write(self.style.SUCCESS(
+            f"Проиндексировано продуктов: {count} за {monotonic() - started:.2f} с"
+        ))
@@ -0,0 +1,26 @@
+from time import sleep
+
+from django.core.management.base import BaseCommand
+
+from basket.telegram import deliver_notifications, get_transport
+
+
+class Command(BaseCommand):
+    help = "Отправка накопившихся уведомлений о заказах в Telegram"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Обработать очередь один раз и выйти")
+        parser.add_argument('--interval', type=float, default=2, help="Пауза между проверками очереди, с")
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--workers', type=int, default=4, help="Количество чатов, обслуживаемых параллельно")
+
+    def handle(self, *args, once, interval, batch_size, workers, **options):
+        transport = get_transport()
+        while True:
+            sent, failed = deliver_notifications(transport, batch_size=batch_size, workers=workers)
+            if sent or failed:
+                self.stdout.write(f"Отправлено: {sent}, ошибок: {failed}")
+            if once:
+                break
+            if not sent:
+                sleep(interval)
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F, Max
+
+from basket.models import Cart
+
+
+class Command(BaseCommand):
+    help = "Поиск и исправление корзин, у которых сохранённая сумма не совпадает с суммой позиций"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help="Количество корзин, проверяемых одним запросом")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Только показать количество расхождений, ничего не исправляя")
+
+    def handle(self, *args, batch_size, dry_run, **options):
+        last_id = Cart.objects.aggregate(last_id=Max('pk'))['last_id'] or 0
+        drifted = repaired = 0
+        for start in range(0, last_id, batch_size):
+            carts = Cart.objects.filter(pk__gt=start, pk__lte=start + batch_size).alias(
+                actual_total=Cart.total_price_expression()
+            ).exclude(total_price=F('actual_total'))
+            if dry_run:
+                drifted += carts.count()
+            else:
+                repaired += carts.update(total_price=Cart.total_price_expression())
+
+        if dry_run:
+            self.stdout.write(f"Найдено корзин с неверной суммой: {drifted}")
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Исправлено корзин: {repaired}"))
@@ -0,0 +1,14 @@
+from .cart import RequestCart
+
+
+class CartMiddleware:
+    """
+    Добавляет в запрос ленивую корзину request.cart.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.cart = RequestCart(request)
+        return self.get_response(request)
@@ -0,0 +1,45 @@
+import re
+
+from django.db import migrations
+
+# Orders stored their contents as "Name: 2 шт, Other name: 1 шт"
+ORDER_ITEM_RE = re.compile(r'(?:^|, )(?P<name>.+?): (?P<quantity>\d+) шт(?=, |$)')
+
+
+def backfill_order_items(apps, schema_editor):
+    """
+    Best-effort разбор строки Order.products в позиции заказа.
+    Цена берётся текущая, если продукт с таким названием ещё существует.
+    """
+    Order = apps.get_model('basket', 'Order')
+    OrderItem = apps.get_model('basket', 'OrderItem')
+    Product = apps.get_model('basket', 'Product')
+
+    products = {product.name: product for product in Product.objects.all()}
+    orders = Order.objects.exclude(products__isnull=True).exclude(products='').filter(items__isnull=True)
+    batch = []
+    for order in orders.iterator(chunk_size=1000):
+        for match in ORDER_ITEM_RE.finditer(order.products):
+            product = products.get(match['name'])
+            batch.append(OrderItem(
+                order_id=order.pk,
+                product=product,
+                product_name=match['name'][:100],
+                unit_price=product.price if product else 0,
+                quantity=int(match['quantity']),
+            ))
+        if len(batch) >= 1000:
+            OrderItem.objects.bulk_create(batch)
+            batch = []
+    OrderItem.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('basket', '0006_orderitem'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_order_items, migrations.RunPython.noop),
+    ]
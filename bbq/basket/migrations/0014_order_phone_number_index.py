@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-18 04:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('basket', '0013_catalogtombstone'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='phone_number',
+            field=models.CharField(blank=True, db_index=True, max_length=20, null=True),
+        ),
+    ]
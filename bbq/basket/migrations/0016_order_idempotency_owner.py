@@ -0,0 +1,43 @@
+# Generated by Django 5.1.4 on 2026-10-18 04:27
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import CharField, Value
+from django.db.models.functions import Cast, Concat
+
+
+def backfill_owners(apps, schema_editor):
+    """
+    Ключи заказов пользователей привязываются к пользователю.
+    Хэш сессии старых гостевых заказов неизвестен: их ключи больше не совпадут ни с кем.
+    """
+    Order = apps.get_model('basket', 'Order')
+    Order.objects.filter(idempotency_key__isnull=False, user__isnull=False).update(
+        idempotency_owner=Concat(Value('user:'), Cast('user_id', CharField()))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('basket', '0015_cart_constraints_order_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='idempotency_owner',
+            field=models.CharField(blank=True, default='', editable=False, max_length=80),
+        ),
+        migrations.RunPython(backfill_owners, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='order',
+            name='idempotency_key',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='order',
+            constraint=models.UniqueConstraint(condition=models.Q(('idempotency_key__isnull', False)), fields=('idempotency_key', 'idempotency_owner'), name='basket_order_unique_idempotency_key'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.1.4 on 2026-10-18 04:30
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def move_failures(apps, schema_editor):
+    """
+    Неудачная обработка раньше отмечалась image_processed_at без размеров.
+    """
+    Product = apps.get_model('basket', 'Product')
+    Product.objects.filter(image_processed_at__isnull=False, image_width__isnull=True).update(
+        image_failed_at=F('image_processed_at'), image_processed_at=None
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('basket', '0016_order_idempotency_owner'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='image_failed_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(move_failures, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-18 04:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('basket', '0017_product_image_failed_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='merged_session',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64),
+        ),
+    ]
@@ -1,7 +1,10 @@
 from uuid import uuid4
 
 from django.db import models
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Now
 from django.urls import reverse
+from django.utils import timezone
 from pytils.translit import slugify
 
 from authapp.models import CustomUser
@@ -20,9 +23,45 @@ def unique_slugify(instance, slug):
 
 
 
+class CatalogQuerySet(models.QuerySet):
+    """
+    Массовые изменения категорий и продуктов не отправляют post_save:
+    версия каталога увеличивается здесь, иначе снимки каталога в других
+    процессах останутся со старыми ценами. update() заодно ставит updated_at
+    (auto_now в UPDATE не участвует), чтобы изменения попали в delta sync.
+    Удаление через QuerySet отправляет post_delete и обрабатывается сигналами.
+    """
+
+    def _catalog_changed(self):
+        from .catalog import bump_catalog_version
+        bump_catalog_version()
+
+    def update(self, **kwargs):
+        kwargs.setdefault('updated_at', Now())
+        updated = super().update(**kwargs)
+        if updated:
+            self._catalog_changed()
+        return updated
+
+    def bulk_create(self, objs, *args, **kwargs):
+        created = super().bulk_create(objs, *args, **kwargs)
+        if created:
+            self._catalog_changed()
+        return created
+
+    def bulk_update(self, objs, *args, **kwargs):
+        updated = super().bulk_update(objs, *args, **kwargs)
+        if updated:
+            self._catalog_changed()
+        return updated
+
+
 class Category(models.Model):
     name = models.CharField(max_length=50, blank=False, null=False, unique=True)
     slug = models.SlugField(max_length=50,blank=True,null=False)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)  # lastmod в карте сайта
+
+    objects = CatalogQuerySet.as_manager()
     def __str__(self):
         return self.name
 
@@ -36,13 +75,47 @@ class Category(models.Model):
 
 
 
+class CatalogVersion(models.Model):
+    """
+    Общий для всех процессов номер версии каталога.
+    Увеличивается при любом изменении категорий и продуктов.
+    """
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)  # Время последнего изменения каталога, для Last-Modified
+
+    def __str__(self):
+        return f"Catalog v{self.version}"
+
+
+class CatalogTombstone(models.Model):
+    """
+    Отметка об удалённой категории или продукте.
+    По ней мобильный клиент узнаёт об удалениях из /api/catalog/changes/.
+    """
+    model = models.CharField(max_length=20, choices=[('category', 'Категория'), ('product', 'Продукт')])
+    object_id = models.PositiveBigIntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f"Deleted {self.model} #{self.object_id}"
+
+
 class Product(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField()
     gram = models.DecimalField(max_digits=10, decimal_places=0, null=True,blank=True)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     image = models.ImageField(upload_to='products/', blank=True, null=True)
+    # Filled in by the process_images worker after the photo is normalized
+    image_width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    image_height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    image_placeholder = models.TextField(blank=True, editable=False)  # Tiny blurred preview as a data: URI
+    image_processed_at = models.DateTimeField(null=True, blank=True, editable=False)
+    image_failed_at = models.DateTimeField(null=True, blank=True, editable=False)  # Not an image: the original is served
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, blank=True, null=True, related_name='products')
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)  # lastmod в карте сайта
+
+    objects = CatalogQuerySet.as_manager()
 
     def __str__(self):
         return self.name
@@ -53,7 +126,17 @@ class Product(models.Model):
 class Cart(models.Model):
     user = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)  # Last change of the cart or its items
     total_price = models.DecimalField(max_digits=10, decimal_places=2, default=0)  # Added total price
+    # sha256 of the guest session merged into the cart last, see cart.merge_guest_cart
+    merged_session = models.CharField(max_length=64, blank=True, default='', editable=False)
+
+    class Meta:
+        constraints = [
+            # Одна корзина на пользователя; гостевых корзин без пользователя может быть сколько угодно
+            models.UniqueConstraint(fields=['user'], condition=models.Q(user__isnull=False),
+                                    name='basket_cart_unique_user'),
+        ]
 
     def __str__(self):
         if self.user:
@@ -61,13 +144,20 @@ class Cart(models.Model):
         else:
             return "Guest Cart"  # Indicate it's a guest cart
 
+    @staticmethod
+    def total_price_expression():
+        """
+        Сумма позиций корзины, вычисляемая в базе: цена * количество.
+        """
+        total = CartItem.objects.filter(cart=OuterRef('pk')).values('cart').annotate(
+            total=Sum(F('product__price') * F('quantity'))
+        ).values('total')
+        return Coalesce(Subquery(total), Value(0), output_field=DecimalField(max_digits=10, decimal_places=2))
+
     def update_total_price(self):
-        try:  # Important error handling
-            total = sum(item.total_price for item in self.items.all())
-            self.total_price = total
-            self.save()
-        except Exception as e:
-            print(f"Error updating cart total price: {e}")
+        # Ошибки не перехватываются: они должны откатить транзакцию вызывающего кода
+        Cart.objects.filter(pk=self.pk).update(total_price=self.total_price_expression(), updated_at=Now())
+        self.refresh_from_db(fields=['total_price', 'updated_at'])
 
 
 class CartItem(models.Model):
@@ -75,6 +165,12 @@ class CartItem(models.Model):
     cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='items')
     quantity = models.PositiveIntegerField(default=1)
 
+    class Meta:
+        constraints = [
+            # Одна строка на продукт в корзине, количество складывается
+            models.UniqueConstraint(fields=['cart', 'product'], name='basket_cartitem_unique_product'),
+        ]
+
     def __str__(self):
         return f"{self.quantity}x {self.product.name}"
 
@@ -96,15 +192,93 @@ class Order(models.Model):
     ], default='pending')
     total_price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     shipping_address = models.CharField(max_length=255, blank=True, null=True)
-    phone_number = models.CharField(max_length=20, blank=True, null=True)
+    phone_number = models.CharField(max_length=20, blank=True, null=True, db_index=True)  # E.164, see phones.py
+    idempotency_key = models.CharField(max_length=64, null=True, blank=True)
+    # Who used the key: 'user:<id>' or 'session:<sha256 of the guest session key>', see checkout.py
+    idempotency_owner = models.CharField(max_length=80, blank=True, default='', editable=False)
+
+    class Meta:
+        constraints = [
+            # Ключ уникален в пределах покупателя; индекс по ключу первым служит и поиску чужого ключа
+            models.UniqueConstraint(fields=['idempotency_key', 'idempotency_owner'],
+                                    condition=models.Q(idempotency_key__isnull=False),
+                                    name='basket_order_unique_idempotency_key'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'order_date'], name='basket_order_user_date_idx'),  # Заказы пользователя
+            models.Index(fields=['status', 'order_date'], name='basket_order_status_date_idx'),  # Очередь по статусу
+        ]
+
+    @staticmethod
+    def describe_items(items):
+        """
+        Строка состава заказа для отображения и уведомлений.
+        """
+        products = ", ".join(f"{item.product.name}: {item.quantity} шт" for item in items)
+        max_length = Order._meta.get_field('products').max_length
+        return products if len(products) <= max_length else products[:max_length - 1] + '…'
+
+    def add_items(self, cart_items):
+        """
+        Сохранение позиций корзины в заказ одним INSERT.
+        """
+        return OrderItem.objects.bulk_create(
+            OrderItem(
+                order=self,
+                product=item.product,
+                product_name=item.product.name,
+                unit_price=item.product.price,
+                quantity=item.quantity,
+            )
+            for item in cart_items
+        )
 
     def update_total_price(self):
-        try:
-            total = sum(item.total_price for item in self.items.all())
-            self.total_price = total
-            self.save()
-        except Exception as e:
-            print(f"Error updating order total price: {e}")
+        total = OrderItem.objects.filter(order=OuterRef('pk')).values('order').annotate(
+            total=Sum(F('unit_price') * F('quantity'))
+        ).values('total')
+        Order.objects.filter(pk=self.pk).update(
+            total_price=Coalesce(Subquery(total), Value(0), output_field=DecimalField(max_digits=10, decimal_places=2))
+        )
+        self.refresh_from_db(fields=['total_price'])
 
     def __str__(self):
         return f"Order #{self.id} for {self.user} ({self.status})"
+
+
+class OrderItem(models.Model):
+    """
+    Позиция заказа: название и цена сохраняются на момент оформления.
+    """
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
+    product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True, blank=True, related_name='order_items')
+    product_name = models.CharField(max_length=100)
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+    quantity = models.PositiveIntegerField(default=1)
+
+    def __str__(self):
+        return f"{self.quantity}x {self.product_name}"
+
+    @property
+    def total_price(self):
+        return self.unit_price * self.quantity
+
+
+class TelegramNotification(models.Model):
+    """
+    Исходящее сообщение в Telegram.
+    Создаётся в одной транзакции с заказом и отправляется командой send_notifications.
+    """
+    chat_id = models.BigIntegerField()
+    text = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['sent_at', 'next_attempt_at'])]
+
+    def __str__(self):
+        return f"Notification #{self.pk} to {self.chat_id}"
@@ -0,0 +1,19 @@
+import phonenumbers
+
+DEFAULT_REGION = 'RU'  # Номера без кода страны, как в OrderForm
+
+
+def normalize_phone(value, region=DEFAULT_REGION):
+    """
+    Номер телефона в формате E.164 (+79817070306) или None, если это не номер.
+    Так номера хранятся в Order.phone_number и так же приводится номер при поиске заказов.
+    """
+    if not value:
+        return None
+    try:
+        number = phonenumbers.parse(str(value), region)
+    except phonenumbers.NumberParseException:
+        return None
+    if not phonenumbers.is_valid_number(number):
+        return None
+    return phonenumbers.format_number(number, phonenumbers.PhoneNumberFormat.E164)
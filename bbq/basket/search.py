@@ -0,0 +1,245 @@
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+from .models import Product
+
+SEARCH_LIMIT = 20
+FTS_TABLE = 'basket_product_fts'
+# Выражение индекса GIN на PostgreSQL; запрос должен повторять его дословно, иначе индекс не используется
+PG_SEARCH_VECTOR = (
+    "setweight(to_tsvector('russian', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('russian', coalesce(description, '')), 'B')"
+)
+
+_WORD_RE = re.compile(r'\w+')
+_VOWELS = 'аеиоуыэюя'
+
+# Окончания для стеммера Snowball (Портер) для русского языка.
+# Пара (окончания, True) означает, что окончанию должна предшествовать «а» или «я».
+_PERFECTIVE_GERUND = [
+    (('в', 'вши', 'вшись'), True),
+    (('ив', 'ивши', 'ившись', 'ыв', 'ывши', 'ывшись'), False),
+]
+_REFLEXIVE = [(('ся', 'сь'), False)]
+_ADJECTIVE = [(
+    ('ее', 'ие', 'ые', 'ое', 'ими', 'ыми', 'ей', 'ий', 'ый', 'ой', 'ем', 'им', 'ым', 'ом', 'его', 'ого',
+     'ему', 'ому', 'их', 'ых', 'ую', 'юю', 'ая', 'яя', 'ою', 'ею'),
+    False,
+)]
+_PARTICIPLE = [
+    (('ем', 'нн', 'вш', 'ющ', 'щ'), True),
+    (('ивш', 'ывш', 'ующ'), False),
+]
+_VERB = [
+    (('ла', 'на', 'ете', 'йте', 'ли', 'й', 'л', 'ем', 'н', 'ло', 'но', 'ет', 'ют', 'ны', 'ть', 'ешь', 'нно'), True),
+    (('ила', 'ыла', 'ена', 'ейте', 'уйте', 'ите', 'или', 'ыли', 'ей', 'уй', 'ил', 'ыл', 'им', 'ым', 'ен', 'ило',
+      'ыло', 'ено', 'ят', 'ует', 'уют', 'ит', 'ыт', 'ены', 'ить', 'ыть', 'ишь', 'ую', 'ю'), False),
+]
+_NOUN = [(
+    ('а', 'ев', 'ов', 'ие', 'ье', 'е', 'иями', 'ями', 'ами', 'еи', 'ии', 'и', 'ией', 'ей', 'ой', 'ий', 'й',
+     'иям', 'ям', 'ием', 'ем', 'ам', 'ом', 'о', 'у', 'ах', 'иях', 'ях', 'ы', 'ь', 'ию', 'ью', 'ю', 'ия', 'ья', 'я'),
+    False,
+)]
+_SUPERLATIVE = [(('ейш', 'ейше'), False)]
+_DERIVATIONAL = [(('ост', 'ость'), False)]
+
+
+def _remove_ending(word, groups):
+    """
+    Отрезание самого длинного подходящего окончания. None, если окончания нет.
+    """
+    best = None
+    for endings, after_a in groups:
+        for ending in endings:
+            if not word.endswith(ending) or (best is not None and len(ending) <= len(best)):
+                continue
+            if after_a and not word[:-len(ending)].endswith(('а', 'я')):
+                continue
+            best = ending
+    return None if best is None else word[:-len(best)]
+
+
+def _region(word, start=0):
+    # Позиция после первой согласной, следующей за гласной (R1/R2 в терминах Snowball)
+    for i in range(start + 1, len(word)):
+        if word[i] not in _VOWELS and word[i - 1] in _VOWELS:
+            return i + 1
+    return len(word)
+
+
+def stem(word):
+    """
+    Основа русского слова по алгоритму Snowball.
+    Слова без русских гласных (латиница, числа) возвращаются без изменений.
+    """
+    word = word.lower().replace('ё', 'е')
+    rv_start = next((i + 1 for i, char in enumerate(word) if char in _VOWELS), None)
+    if rv_start is None:
+        return word
+    head, rv = word[:rv_start], word[rv_start:]
+
+    removed = _remove_ending(rv, _PERFECTIVE_GERUND)
+    if removed is not None:
+        rv = removed
+    else:
+        removed = _remove_ending(rv, _REFLEXIVE)
+        if removed is not None:
+            rv = removed
+        removed = _remove_ending(rv, _ADJECTIVE)
+        if removed is not None:
+            rv = _remove_ending(removed, _PARTICIPLE)
+            rv = removed if rv is None else rv
+        else:
+            removed = _remove_ending(rv, _VERB)
+            if removed is None:
+                removed = _remove_ending(rv, _NOUN)
+            if removed is not None:
+                rv = removed
+
+    if rv.endswith('и'):
+        rv = rv[:-1]
+
+    r2_start = _region(word, _region(word))
+    word = head + rv
+    if r2_start < len(word):
+        removed = _remove_ending(word[r2_start:], _DERIVATIONAL)
+        if removed is not None:
+            word = word[:r2_start] + removed
+
+    head, rv = word[:rv_start], word[rv_start:]
+    if rv.endswith('нн'):
+        rv = rv[:-1]
+    else:
+        removed = _remove_ending(rv, _SUPERLATIVE)
+        if removed is not None:
+            rv = removed[:-1] if removed.endswith('нн') else removed
+        elif rv.endswith('ь'):
+            rv = rv[:-1]
+    return head + rv
+
+
+def tokenize(text):
+    return [stem(word) for word in _WORD_RE.findall(text or '')]
+
+
+class FtsSearchBackend:
+    """
+    SQLite: виртуальная таблица FTS5 с основами слов, rowid совпадает с id продукта.
+    Основы считаются в Python, так как у FTS5 нет русского стеммера.
+    """
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        terms = tokenize(query)
+        if not terms:
+            return []
+        # Each term is quoted, so user input cannot use the FTS query syntax; * gives prefix matching
+        match = ' '.join('"%s"*' % term.replace('"', '""') for term in terms)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+                f'ORDER BY bm25({FTS_TABLE}, 10.0, 1.0) LIMIT %s',
+                [match, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def index(self, products):
+        rows = [(product.pk, ' '.join(tokenize(product.name)), ' '.join(tokenize(product.description)))
+                for product in products]
+        if not rows:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [(row[0],) for row in rows])
+            cursor.executemany(f'INSERT INTO {FTS_TABLE} (rowid, name, description) VALUES (%s, %s, %s)', rows)
+
+    def remove(self, product_ids):
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [(pk,) for pk in product_ids])
+
+    def rebuild(self, batch_size=1000):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        count = 0
+        batch = []
+        for product in Product.objects.only('pk', 'name', 'description').order_by('pk').iterator(batch_size):
+            batch.append(product)
+            if len(batch) == batch_size:
+                self.index(batch)
+                count += len(batch)
+                batch = []
+        self.index(batch)
+        return count + len(batch)
+
+
+class PostgresSearchBackend:
+    """
+    PostgreSQL: tsvector с русским словарём по выражению с индексом GIN.
+    Индекс поддерживает сама база, синхронизировать ничего не нужно.
+    """
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        terms = _WORD_RE.findall(query or '')
+        if not terms:
+            return []
+        tsquery = ' & '.join(f'{term}:*' for term in terms)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT id FROM basket_product WHERE ({PG_SEARCH_VECTOR}) @@ to_tsquery('russian', %s) "
+                f"ORDER BY ts_rank({PG_SEARCH_VECTOR}, to_tsquery('russian', %s)) DESC, id LIMIT %s",
+                [tsquery, tsquery, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def index(self, products):
+        pass
+
+    def remove(self, product_ids):
+        pass
+
+    def rebuild(self, batch_size=1000):
+        with connection.cursor() as cursor:
+            cursor.execute('REINDEX INDEX basket_product_search_idx')
+        return Product.objects.count()
+
+
+class ContainsSearchBackend:
+    """
+    Остальные базы: поиск подстроки без индекса.
+    """
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        terms = _WORD_RE.findall(query or '')
+        if not terms:
+            return []
+        products = Product.objects.all()
+        for term in terms:
+            products = products.filter(Q(name__icontains=term) | Q(description__icontains=term))
+        return list(products.order_by('pk').values_list('pk', flat=True)[:limit])
+
+    def index(self, products):
+        pass
+
+    def remove(self, product_ids):
+        pass
+
+    def rebuild(self, batch_size=1000):
+        return Product.objects.count()
+
+
+def get_search_backend():
+    """
+    Бэкенд поиска по типу базы из DATABASE_URL.
+    """
+    if connection.vendor == 'sqlite':
+        return FtsSearchBackend()
+    if connection.vendor == 'postgresql':
+        return PostgresSearchBackend()
+    return ContainsSearchBackend()
+
+
+def search_products(query, limit=SEARCH_LIMIT):
+    """
+    id найденных продуктов, самые релевантные первыми.
+    """
+    return get_search_backend().search(query, limit)
@@ -0,0 +1,58 @@
+from django.contrib.auth.signals import user_logged_in
+from django.db.models.signals import post_save, post_delete, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from authapp.models import CustomUser
+
+from .cart import merge_guest_cart
+from .catalog import bump_catalog_version
+from .changes import record_deletion
+from .images import mark_unprocessed
+from .models import Category, Product
+from .search import get_search_backend
+
+
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=Product)
+def invalidate_catalog(sender, **kwargs):
+    bump_catalog_version()
+
+
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Product)
+def record_catalog_deletion(sender, instance, **kwargs):
+    record_deletion(instance)
+
+
+@receiver(pre_delete, sender=Category)
+def touch_category_products(sender, instance, **kwargs):
+    # SET_NULL is a bulk UPDATE that skips auto_now: mark the products as changed for delta sync
+    Product.objects.filter(category=instance).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, **kwargs):
+    get_search_backend().index([instance])
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    get_search_backend().remove([instance.pk])
+
+
+@receiver(pre_save, sender=Product)
+def queue_product_image(sender, instance, **kwargs):
+    # New photos are normalized and thumbnailed by process_images, never in the request
+    mark_unprocessed(instance, 'image')
+
+
+@receiver(pre_save, sender=CustomUser)
+def queue_user_avatar(sender, instance, **kwargs):
+    mark_unprocessed(instance, 'avatar')
+
+
+@receiver(user_logged_in)
+def merge_cart_on_login(sender, request, user, **kwargs):
+    if request is not None:
+        merge_guest_cart(request, user)
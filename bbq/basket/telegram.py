@@ -1,12 +1,163 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
 from os import environ
 
-import telebot
-from telebot import apihelper
-bot = telebot.TeleBot('8010937064:AAE35qP4DLE00VwyGpmb8nbDjSb3y4qQunk')
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import TelegramNotification
+
+TELEGRAM_TOKEN = environ.get('TELEGRAM_BOT_TOKEN', '8010937064:AAE35qP4DLE00VwyGpmb8nbDjSb3y4qQunk')
+MESSAGE_LIMIT = 4096  # Telegram rejects longer messages
+DIGEST_SEPARATOR = '\n\n'
+
+
+class RateLimited(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"Too many requests, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class BotTransport:
+    """
+    Отправка через Telegram Bot API.
+    """
+
+    def __init__(self):
+        import telebot
+        self.bot = telebot.TeleBot(TELEGRAM_TOKEN)
+
+    def send(self, chat_id, text):
+        from telebot.apihelper import ApiTelegramException
+        try:
+            self.bot.send_message(chat_id, text)
+        except ApiTelegramException as e:
+            if e.error_code == 429:
+                raise RateLimited(e.result_json.get('parameters', {}).get('retry_after', 1)) from e
+            raise
+
+
+class LocMemTransport:
+    """
+    Транспорт для тестов: сообщения складываются в LocMemTransport.outbox.
+    """
+    outbox = []
+
+    def send(self, chat_id, text):
+        self.outbox.append((chat_id, text))
+
+
+def get_transport():
+    return import_string(settings.TELEGRAM_TRANSPORT)()
+
+
+def format_order_message(order):
+    return (
+        f'Номер заказа: {order.pk}\n '
+        f'Телефон: {order.phone_number}\n'
+        f'Адрес: {order.shipping_address}\n'
+        f'заказ: {order.products}\n'
+        f'Общая сумма {order.total_price}руб\n'
+        f'Дополнительная информация'
+    )
+
 
-# from telebot import types
 def send_message(message):
-    chat_id_2 = 7169510671
-    chat_id_fox = 939130884
-    bot.send_message(chat_id_2, message)
-    bot.send_message(chat_id_fox, message)
+    """
+    Постановка сообщения в очередь для всех чатов из TELEGRAM_CHAT_IDS.
+    Вызывается внутри транзакции заказа, отправкой занимается send_notifications.
+    """
+    TelegramNotification.objects.bulk_create(
+        TelegramNotification(chat_id=chat_id, text=message) for chat_id in settings.TELEGRAM_CHAT_IDS
+    )
+
+
+def build_digests(notifications):
+    """
+    Склейка накопившихся сообщений одного чата в сообщения до MESSAGE_LIMIT символов.
+    Возвращает список пар (текст, уведомления).
+    """
+    digests = []
+    text, batch = '', []
+    for notification in notifications:
+        candidate = f'{text}{DIGEST_SEPARATOR}{notification.text}' if batch else notification.text
+        if batch and len(candidate) > MESSAGE_LIMIT:
+            digests.append((text, batch))
+            candidate, batch = notification.text, []
+        text = candidate[:MESSAGE_LIMIT]
+        batch.append(notification)
+    if batch:
+        digests.append((text, batch))
+    return digests
+
+
+def claim_notifications(batch_size, lease):
+    """
+    Выбор готовых к отправке уведомлений. На время отправки они откладываются
+    на lease секунд, чтобы их не взял другой процесс.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        due = TelegramNotification.objects.filter(
+            sent_at__isnull=True, next_attempt_at__lte=now, attempts__lt=settings.TELEGRAM_MAX_ATTEMPTS,
+        ).order_by('pk')
+        notifications = list(due.select_for_update(skip_locked=True)[:batch_size])
+        TelegramNotification.objects.filter(pk__in=[n.pk for n in notifications]).update(
+            next_attempt_at=now + timedelta(seconds=lease)
+        )
+    return notifications
+
+
+def _send_chat(transport, chat_id, digests):
+    sent, failed = [], []
+    for position, (text, notifications) in enumerate(digests):
+        try:
+            transport.send(chat_id, text)
+        except Exception as e:
+            # Later digests of this chat are retried together with the failed one
+            for _, rest in digests[position:]:
+                failed.append((rest, e))
+            break
+        sent.extend(notifications)
+    return sent, failed
+
+
+def deliver_notifications(transport, batch_size=100, workers=4, lease=60):
+    """
+    Отправка очереди: чаты обрабатываются параллельно, сообщения одного чата
+    склеиваются в дайджесты. Возвращает количество отправленных и неудачных уведомлений.
+    """
+    by_chat = {}
+    for notification in claim_notifications(batch_size, lease):
+        by_chat.setdefault(notification.chat_id, []).append(notification)
+    if not by_chat:
+        return 0, 0
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(
+            lambda chat: _send_chat(transport, chat[0], build_digests(chat[1])), by_chat.items()
+        ))
+
+    now = timezone.now()
+    sent_ids = [n.pk for sent, _ in results for n in sent]
+    TelegramNotification.objects.filter(pk__in=sent_ids).update(
+        sent_at=now, attempts=F('attempts') + 1, last_error=''
+    )
+    failed_count = 0
+    for _, failed in results:
+        for notifications, error in failed:
+            if isinstance(error, RateLimited):
+                # Not a failure: wait as long as Telegram asked, without spending an attempt
+                updates = {'next_attempt_at': now + timedelta(seconds=error.retry_after)}
+            else:
+                attempts = max(n.attempts for n in notifications)
+                delay = min(settings.TELEGRAM_RETRY_BASE * 2 ** attempts, settings.TELEGRAM_RETRY_MAX)
+                updates = {'attempts': F('attempts') + 1, 'next_attempt_at': now + timedelta(seconds=delay)}
+            TelegramNotification.objects.filter(pk__in=[n.pk for n in notifications]).update(
+                last_error=str(error), **updates
+            )
+            failed_count += len(notifications)
+    return len(sent_ids), failed_count
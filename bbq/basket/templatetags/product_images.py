@@ -0,0 +1,38 @@
+from django import template
+from django.forms.utils import flatatt
+from django.utils.html import format_html
+
+from basket.thumbnails import PICTURE_SIZES, thumbnail_srcset, thumbnail_url
+
+register = template.Library()
+
+
+@register.simple_tag
+def product_picture(product, alias, **attrs):
+    """
+    <picture> с миниатюрами продукта: WebP и JPEG в двух плотностях, ленивая загрузка.
+    Пока фото не обработано process_images (или если обработать его не удалось),
+    миниатюр нет и показывается оригинал.
+    Использование: {% product_picture product 'card' class='img-fluid' style='height: 200px' %}
+    """
+    if product.image_processed_at is None:
+        attrs = {'src': product.image.url, 'alt': product.name, 'loading': 'lazy', **attrs}
+        return format_html('<img{}>', flatatt(attrs))
+    if product.image_placeholder:
+        # The blurred preview is shown until the thumbnail arrives
+        attrs['style'] = (f"background: url('{product.image_placeholder}') center / cover no-repeat; "
+                          f"{attrs.get('style', '')}")
+    sizes = PICTURE_SIZES[alias]
+    img_attrs = {
+        'src': thumbnail_url(product.image, alias),
+        'srcset': thumbnail_srcset(product.image, alias),
+        'sizes': sizes,
+        'alt': product.name,
+        'loading': 'lazy',
+        'decoding': 'async',
+        **attrs,
+    }
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}"><img{}></picture>',
+        thumbnail_srcset(product.image, alias, 'webp'), sizes, flatatt(img_attrs),
+    )
@@ -0,0 +1,774 @@
+import gzip
+import shutil
+from datetime import timedelta
+from decimal import Decimal
+from importlib import import_module
+from threading import Barrier, Thread
+from io import BytesIO, StringIO
+from unittest import skipUnless
+from unittest.mock import patch
+from tempfile import mkdtemp
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import close_old_connections, connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from api.throttling import get_counter_store
+from authapp.models import CustomUser
+from bbq.sitemaps import generate_sitemaps
+from .cart import merge_guest_cart
+from .catalog import get_catalog
+from .search import search_products, stem
+from .templatetags.product_images import product_picture
+from .thumbnails import thumbnail_url
+from .models import Category, Product, CatalogVersion, Cart, CartItem, Order, TelegramNotification
+from .telegram import LocMemTransport, RateLimited, deliver_notifications, send_message, MESSAGE_LIMIT
+
+
+def create_catalog(categories_count, products_per_category=3):
+    start = Category.objects.count()
+    for i in range(start, start + categories_count):
+        category = Category.objects.create(name=f'Категория {i}')
+        Product.objects.bulk_create(
+            Product(name=f'Товар {i}-{j}', description='', price=100 + j, category=category)
+            for j in range(products_per_category)
+        )
+
+
+class CatalogQueriesTest(TestCase):
+    def count_queries(self, url):
+        self.client.cookies.clear()
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx)
+
+    def test_product_list_query_count_is_fixed(self):
+        create_catalog(2)
+        small = self.count_queries(reverse('basket:product_list'))
+        create_catalog(10)
+        large = self.count_queries(reverse('basket:product_list'))
+        self.assertEqual(small, large)
+        self.assertEqual(large, 3)
+
+    def test_category_detail_query_count_is_fixed(self):
+        create_catalog(2)
+        url = reverse('basket:category_detail', args=[Category.objects.first().slug])
+        small = self.count_queries(url)
+        create_catalog(10)
+        self.assertEqual(small, self.count_queries(url))
+
+    def test_product_list_renders_grouped_products(self):
+        create_catalog(2, products_per_category=2)
+        response = self.client.get(reverse('basket:product_list'))
+        grouped = response.context['products_by_category']
+        self.assertEqual([category.name for category in grouped], ['Категория 0', 'Категория 1'])
+        self.assertEqual([product.name for product in grouped[Category.objects.get(name='Категория 1')]],
+                         ['Товар 1-0', 'Товар 1-1'])
+        self.assertContains(response, 'Товар 1-1')
+
+    def test_category_detail_unknown_slug(self):
+        response = self.client.get(reverse('basket:category_detail', args=['missing']))
+        self.assertEqual(response.status_code, 404)
+
+
+class ConditionalGetTest(TestCase):
+    def setUp(self):
+        create_catalog(2)
+
+    def test_product_list_not_modified(self):
+        url = reverse('basket:product_list')
+        self.client.get(url)  # The first visit sets the CSRF cookie
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        product = Product.objects.first()
+        product.name = 'Новое имя'
+        product.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Новое имя')
+
+    def test_cart_change_changes_etag(self):
+        url = reverse('basket:product_detail', args=[Product.objects.first().pk])
+        self.client.get(url)
+        etag = self.client.get(url)['ETag']
+        self.client.get(reverse('basket:add_to_cart', args=[Product.objects.first().pk]))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class ProductSearchTest(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Шашлык')
+        self.pork = Product.objects.create(name='Шашлык из свинины', description='Сочная шейка на углях',
+                                           price=500, category=self.category)
+        self.chicken = Product.objects.create(name='Куриные крылышки', description='Маринованные в соусе',
+                                              price=300, category=self.category)
+
+    def test_stemming(self):
+        self.assertEqual(stem('шашлыки'), stem('шашлыка'))
+        self.assertEqual(stem('крылышки'), stem('крылышко'))
+        self.assertEqual(stem('Ёлки'), stem('елка'))
+        self.assertEqual(stem('BBQ'), 'bbq')
+
+    def test_search_word_forms_and_prefixes(self):
+        self.assertEqual(search_products('шашлыки'), [self.pork.pk])
+        self.assertEqual(search_products('крыл'), [self.chicken.pk])
+        self.assertEqual(search_products('соус'), [self.chicken.pk])
+        self.assertEqual(search_products('свинина угли'), [self.pork.pk])
+        self.assertEqual(search_products('" OR *'), [])
+
+    def test_name_matches_rank_first(self):
+        beef = Product.objects.create(name='Говядина', description='Лучше, чем шашлык', price=600)
+        self.assertEqual(search_products('шашлык'), [self.pork.pk, beef.pk])
+
+    def test_index_follows_changes(self):
+        self.pork.name = 'Люля-кебаб'
+        self.pork.save()
+        self.assertEqual(search_products('шашлык'), [])
+        self.assertEqual(search_products('кебаб'), [self.pork.pk])
+        self.chicken.delete()
+        self.assertEqual(search_products('крылышки'), [])
+
+    def test_rebuild_command(self):
+        Product.objects.bulk_create([Product(name='Лаваш', description='', price=40)])  # Signals are not sent
+        self.assertEqual(search_products('лаваш'), [])
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn('Проиндексировано продуктов: 3', out.getvalue())
+        self.assertEqual(len(search_products('лаваш')), 1)
+
+    def test_search_page(self):
+        response = self.client.get(reverse('basket:search'), {'q': 'крылышко'})
+        self.assertEqual(list(response.context['products']), [self.chicken])
+        self.assertContains(response, 'Куриные крылышки')
+        self.assertContains(self.client.get(reverse('basket:search'), {'q': 'пицца'}), 'ничего не найдено')
+
+
+def create_image(name='photo.png', size=(1600, 1200), mode='RGBA', image_format='PNG', **save_options):
+    from PIL import Image
+    buffer = BytesIO()
+    Image.new(mode, size, (200, 80, 40, 255)[:len(mode)]).save(buffer, format=image_format, **save_options)
+    return SimpleUploadedFile(name, buffer.getvalue())
+
+
+class ThumbnailTest(TestCase):
+    def setUp(self):
+        root = mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        self.enterContext(override_settings(MEDIA_ROOT=root))
+        category = Category.objects.create(name='Шашлык')
+        self.product = Product.objects.create(name='Свинина', description='', price=500, category=category,
+                                              image=create_image())
+        call_command('process_images', '--once', '--workers', '1', stdout=StringIO())
+        self.product.refresh_from_db()
+
+    def test_thumbnails_are_generated_by_worker(self):
+        from PIL import Image
+        for alias, size in [('card', (400, 300)), ('cart_2x', (100, 100)), ('detail', (600, 450))]:
+            for extension in ('webp', 'jpg'):
+                url = thumbnail_url(self.product.image, alias, extension)
+                self.assertTrue(url.endswith('.' + extension))
+                with default_storage.open(url[len(settings.MEDIA_URL):]) as file:
+                    self.assertEqual(Image.open(file).size, size)
+
+    def test_pages_use_srcset(self):
+        response = self.client.get(reverse('basket:product_list'))
+        self.assertContains(response, 'type="image/webp"')
+        self.assertContains(response, thumbnail_url(self.product.image, 'card_2x', 'webp') + ' 800w')
+        self.assertContains(response, 'loading="lazy"')
+        self.assertNotContains(response, f'src="{self.product.image.url}"')
+
+    def test_generate_thumbnails_command(self):
+        out = StringIO()
+        call_command('generate_thumbnails', stdout=out)
+        self.assertIn('Обработано фотографий: 1, с ошибками: 0', out.getvalue())
+
+
+class ImagePipelineTest(TestCase):
+    def setUp(self):
+        root = mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        self.enterContext(override_settings(MEDIA_ROOT=root))
+
+    def process(self):
+        out = StringIO()
+        call_command('process_images', '--once', '--workers', '1', stdout=out, stderr=StringIO())
+        return out.getvalue()
+
+    def test_photo_is_normalized(self):
+        from PIL import Image
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Rotated 90° by the camera
+        exif[0x010F] = 'Camera maker'
+        product = Product.objects.create(name='Свинина', description='', price=500, image=create_image(
+            'camera.jpeg', size=(4000, 3000), mode='RGB', image_format='JPEG', exif=exif,
+        ))
+        original = product.image.name
+        self.assertIn('Обработано: 1, ошибок: 0', self.process())
+
+        product.refresh_from_db()
+        self.assertEqual((product.image_width, product.image_height), (1500, 2000))
+        self.assertTrue(product.image.name.endswith('.jpg'))
+        self.assertTrue(product.image_placeholder.startswith('data:image/jpeg;base64,'))
+        self.assertFalse(default_storage.exists(original))
+        with default_storage.open(product.image.name) as file:
+            image = Image.open(file)
+            self.assertEqual(image.size, (1500, 2000))
+            self.assertEqual(len(image.getexif()), 0)
+        self.assertEqual(self.process(), '')
+
+    def test_new_upload_is_queued_again(self):
+        user = CustomUser.objects.create_user(email='user@example.com', username='user', password='secret',
+                                              avatar=create_image(size=(1024, 1024)))
+        self.process()
+        user.refresh_from_db()
+        self.assertEqual(user.avatar_width, 512)
+        self.assertTrue(user.avatar.name.endswith('.png'))  # Transparency is kept
+
+        user.first_name = 'Иван'
+        user.save()
+        self.assertIsNotNone(user.avatar_processed_at)
+        user.avatar = create_image(size=(300, 200))
+        user.save()
+        user.refresh_from_db()
+        self.assertIsNone(user.avatar_processed_at)
+
+    def test_broken_file_is_not_retried(self):
+        product = Product.objects.create(name='Лаваш', description='', price=40,
+                                         image=SimpleUploadedFile('broken.jpg', b'not an image'))
+        self.assertIn('ошибок: 1', self.process())
+        self.assertEqual(self.process(), '')
+        product.refresh_from_db()
+        self.assertIsNotNone(product.image_failed_at)
+        self.assertIsNone(product.image_processed_at)
+        # No thumbnails were made: the original is served
+        self.assertIsNone(self.client.get(f'/api/products/{product.pk}/').json()['image_sizes'])
+        self.assertEqual(product_picture(product, 'card'),
+                         f'<img alt="Лаваш" loading="lazy" src="{product.image.url}">')
+
+    def test_storage_error_is_retried(self):
+        product = Product.objects.create(name='Свинина', description='', price=500, image=create_image())
+        with patch('django.core.files.storage.FileSystemStorage._open', side_effect=OSError('Timed out')):
+            self.assertIn('ошибок: 1', self.process())
+        product.refresh_from_db()
+        self.assertIsNone(product.image_failed_at)
+        self.assertIn('Обработано: 1', self.process())
+
+    def test_cleanup_media(self):
+        product = Product.objects.create(name='Свинина', description='', price=500, image=create_image())
+        self.process()
+        product.refresh_from_db()
+        orphan = default_storage.save('products/orphan.jpg', SimpleUploadedFile('orphan.jpg', b'data'))
+        thumbnail = default_storage.save(f'{orphan}.400x300_q80_crop.webp', SimpleUploadedFile('t.webp', b'data'))
+
+        out = StringIO()
+        call_command('cleanup_media', '--min-age-hours', '0', '--dry-run', stdout=out)
+        self.assertIn(thumbnail, out.getvalue())
+        self.assertTrue(default_storage.exists(orphan))
+        call_command('cleanup_media', '--min-age-hours', '0', stdout=StringIO())
+        self.assertFalse(default_storage.exists(orphan))
+        self.assertFalse(default_storage.exists(thumbnail))
+        self.assertTrue(default_storage.exists(product.image.name))
+        self.assertTrue(default_storage.exists(thumbnail_url(product.image, 'card')[len(settings.MEDIA_URL):]))
+
+
+class SitemapTest(TestCase):
+    def setUp(self):
+        root = mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        self.enterContext(override_settings(SITEMAP_ROOT=root))
+        create_catalog(2, products_per_category=3)
+
+    def test_index_and_sections_are_served_gzipped(self):
+        response = self.client.get('/sitemap.xml', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        index = gzip.decompress(b''.join(response.streaming_content)).decode()
+        self.assertIn('https://example.com/sitemap-products-1.xml', index)
+
+        response = self.client.get('/sitemap-products-1.xml')  # No gzip support: decompressed on the fly
+        self.assertFalse(response.has_header('Content-Encoding'))
+        urls = b''.join(response.streaming_content).decode()
+        product = Product.objects.first()
+        self.assertIn(f'<loc>https://example.com/products/{product.pk}/</loc>'
+                      f'<lastmod>{product.updated_at.isoformat(timespec="seconds")}</lastmod>', urls)
+        self.assertEqual(urls.count('<url>'), 6)
+        self.assertEqual(self.client.get('/sitemap-missing-1.xml').status_code, 404)
+
+    def test_regenerated_only_when_catalog_changes(self):
+        self.client.get('/sitemap.xml')
+        with self.assertNumQueries(1):  # Only the catalog version
+            self.client.get('/sitemap.xml')
+        Product.objects.create(name='Новый', description='', price=1)
+        urls = b''.join(self.client.get('/sitemap-products-1.xml').streaming_content).decode()
+        self.assertEqual(urls.count('<url>'), 7)
+
+    def test_sections_are_sharded(self):
+        directory = generate_sitemaps(limit=4)
+        self.assertTrue((directory / 'sitemap-products-2.xml.gz').exists())
+        with gzip.open(directory / 'sitemap.xml.gz', 'rt') as index:
+            self.assertEqual(index.read().count('<sitemap>'), 4)  # static, categories, 2 x products
+
+        # The same catalog version generated again replaces the directory, no stale shards are left
+        self.assertEqual(generate_sitemaps(), directory)
+        self.assertFalse((directory / 'sitemap-products-2.xml.gz').exists())
+        self.assertEqual([path.name for path in directory.parent.iterdir()], [directory.name])
+
+
+class CatalogSnapshotTest(TestCase):
+    def setUp(self):
+        create_catalog(2, products_per_category=2)
+
+    def test_snapshot_is_reused_until_version_changes(self):
+        snapshot = get_catalog()
+        with self.assertNumQueries(1):
+            self.assertIs(get_catalog(), snapshot)
+
+    def test_product_save_invalidates_snapshot(self):
+        snapshot = get_catalog()
+        product = Product.objects.first()
+        product.name = 'Новое имя'
+        product.save()
+        fresh = get_catalog()
+        self.assertIsNot(fresh, snapshot)
+        self.assertGreater(fresh.version, snapshot.version)
+        self.assertEqual(fresh.products_by_id[product.pk].name, 'Новое имя')
+
+    def test_category_delete_invalidates_snapshot(self):
+        category = Category.objects.first()
+        self.assertIn(category.slug, get_catalog().categories_by_slug)
+        category.delete()
+        self.assertNotIn(category.slug, get_catalog().categories_by_slug)
+
+    def test_bulk_writes_invalidate_snapshot(self):
+        snapshot = get_catalog()
+        product = Product.objects.first()
+        Product.objects.filter(pk=product.pk).update(price=999)
+        fresh = get_catalog()
+        self.assertGreater(CatalogVersion.objects.get().version, snapshot.version)  # Seen by other processes
+        self.assertEqual(fresh.products_by_id[product.pk].price, 999)
+        self.assertGreater(fresh.products_by_id[product.pk].updated_at, product.updated_at)
+        Product.objects.bulk_create([Product(name='Лаваш', description='', price=40)])
+        self.assertGreater(get_catalog().version, fresh.version)
+
+    def test_version_bump_from_another_process(self):
+        snapshot = get_catalog()
+        CatalogVersion.objects.update(version=snapshot.version + 1)
+        self.assertEqual(get_catalog().version, snapshot.version + 1)
+
+    def test_snapshot_is_immutable(self):
+        snapshot = get_catalog()
+        with self.assertRaises(AttributeError):
+            snapshot.products = ()
+        with self.assertRaises(TypeError):
+            snapshot.products_by_id[0] = None
+
+    def test_products_grouped_by_category(self):
+        snapshot = get_catalog()
+        for category, products in snapshot.products_by_category.items():
+            self.assertTrue(all(product.category is category for product in products))
+
+
+class RequestCartTest(TestCase):
+    def setUp(self):
+        create_catalog(1, products_per_category=3)
+        self.products = list(Product.objects.all())
+        self.user = CustomUser.objects.create_user(email='user@example.com', username='user', password='secret')
+
+    def test_read_only_pages_do_not_create_carts(self):
+        self.client.get(reverse('basket:product_list'))
+        self.client.get(reverse('basket:cart_detail'))
+        self.client.get(reverse('basket:show_checkout_form'))
+        self.assertFalse(Cart.objects.exists())
+
+    def test_guest_cart_is_stored_in_session(self):
+        for product in self.products:
+            response = self.client.post(reverse('basket:add_to_cart', args=[product.pk]))
+        self.assertEqual(response.json(), {'cart-count': 3})
+        self.client.post(reverse('basket:update_cart', args=[self.products[0].pk]), {'new_quantity': 5})
+        self.client.get(reverse('basket:remove_from_cart', args=[self.products[1].pk]))
+        self.assertFalse(Cart.objects.exists())
+        self.assertEqual(self.client.session['cart'], {str(self.products[0].pk): 5, str(self.products[2].pk): 1})
+        response = self.client.get(reverse('basket:cart_detail'))
+        self.assertEqual(response.context['total_price'], Decimal('602.00'))
+
+    def test_guest_checkout_does_not_create_cart(self):
+        self.client.post(reverse('basket:add_to_cart', args=[self.products[0].pk]))
+        response = self.client.post(reverse('basket:checkout'), {
+            'shipping_address': 'Невский проспект, 1', 'phone_number': '+79817070306',
+        })
+        self.assertRedirects(response, reverse('basket:success_guest'), fetch_redirect_response=False)
+        self.assertFalse(Cart.objects.exists())
+        order = Order.objects.get()
+        self.assertEqual(order.total_price, Decimal('100.00'))
+        self.assertEqual(order.products, 'Товар 0-0: 1 шт')
+        self.assertEqual(list(order.items.values_list('product_name', 'unit_price', 'quantity')),
+                         [('Товар 0-0', Decimal('100.00'), 1)])
+        self.assertNotIn('cart', self.client.session)
+        self.assertEqual(TelegramNotification.objects.count(), len(settings.TELEGRAM_CHAT_IDS))
+
+    def test_guest_cart_is_materialized_at_login(self):
+        self.client.post(reverse('basket:add_to_cart', args=[self.products[0].pk]))
+        self.client.post(reverse('basket:add_to_cart', args=[self.products[0].pk]))
+        self.client.force_login(self.user)
+        cart = Cart.objects.get(user=self.user)
+        self.assertEqual(cart.total_price, Decimal('200.00'))
+        self.assertEqual(cart.items.get().quantity, 2)
+        self.assertNotIn('cart', self.client.session)
+
+    def test_login_merge_sums_quantities_in_one_upsert(self):
+        first, second = self.products[:2]
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=first, quantity=1)
+
+        def login_request():
+            request = RequestFactory().post('/login/')
+            request.COOKIES[settings.SESSION_COOKIE_NAME] = 'guest-key'
+            request.session = import_module(settings.SESSION_ENGINE).SessionStore()
+            request.session['cart'] = {str(first.pk): 2, str(second.pk): 1}
+            return request
+
+        with CaptureQueriesContext(connection) as ctx:
+            merge_guest_cart(login_request(), self.user)
+        self.assertEqual(len([query for query in ctx if query['sql'].startswith('INSERT')]), 1)
+        self.assertEqual(dict(cart.items.values_list('product_id', 'quantity')), {first.pk: 3, second.pk: 1})
+        cart.refresh_from_db()
+        self.assertEqual(cart.total_price, Decimal('401.00'))
+
+        cache.clear()  # The guard lives in the database, not in a per-process cache
+        merge_guest_cart(login_request(), self.user)  # The same guest session logging in from a second tab
+        self.assertEqual(dict(cart.items.values_list('product_id', 'quantity')), {first.pk: 3, second.pk: 1})
+
+    def test_user_cart_loads_items_in_one_query(self):
+        self.client.force_login(self.user)
+        for product in self.products:
+            self.client.post(reverse('basket:add_to_cart', args=[product.pk]))
+        response = self.client.get(reverse('basket:cart_detail'))
+        self.assertEqual(len(response.context['cart_items']), 3)
+        self.assertEqual(Cart.objects.count(), 1)
+        cart = response.wsgi_request.cart
+        cart.__dict__.pop('instance', None)
+        with CaptureQueriesContext(connection) as ctx:
+            cart.refresh()
+            cart.total_price
+        self.assertEqual(len(ctx), 1)
+
+
+class CartTotalTest(TestCase):
+    def setUp(self):
+        create_catalog(1, products_per_category=5)
+        self.cart = Cart.objects.create()
+        CartItem.objects.bulk_create(
+            CartItem(cart=self.cart, product=product, quantity=2) for product in Product.objects.all()
+        )
+
+    def test_update_total_price_is_computed_in_database(self):
+        with self.assertNumQueries(2):
+            self.cart.update_total_price()
+        self.assertEqual(self.cart.total_price, Decimal('1020.00'))
+
+    def test_empty_cart_total_is_zero(self):
+        self.cart.items.all().delete()
+        self.cart.update_total_price()
+        self.assertEqual(self.cart.total_price, 0)
+
+    def test_verify_cart_totals_repairs_drift(self):
+        correct = Cart.objects.create()
+        Cart.objects.filter(pk=self.cart.pk).update(total_price=1)
+        out = StringIO()
+        call_command('verify_cart_totals', '--dry-run', batch_size=1, stdout=out)
+        self.assertIn('неверной суммой: 1', out.getvalue())
+        call_command('verify_cart_totals', stdout=out)
+        self.cart.refresh_from_db()
+        correct.refresh_from_db()
+        self.assertEqual(self.cart.total_price, Decimal('1020.00'))
+        self.assertEqual(correct.total_price, 0)
+
+
+class PurgeCartsTest(TestCase):
+    def test_purges_only_abandoned_guest_carts(self):
+        create_catalog(1, products_per_category=2)
+        user = CustomUser.objects.create_user(email='user@example.com', username='user', password='secret')
+        abandoned = [Cart.objects.create() for _ in range(3)]
+        fresh = Cart.objects.create()
+        user_cart = Cart.objects.create(user=user)
+        for cart in abandoned + [fresh]:
+            CartItem.objects.bulk_create(CartItem(cart=cart, product=product) for product in Product.objects.all())
+        long_ago = timezone.now() - timedelta(days=31)
+        Cart.objects.exclude(pk=fresh.pk).update(created_at=long_ago, updated_at=long_ago)
+
+        out = StringIO()
+        call_command('purge_carts', batch_size=2, stdout=out)
+
+        self.assertEqual(set(Cart.objects.values_list('pk', flat=True)), {fresh.pk, user_cart.pk})
+        self.assertEqual(CartItem.objects.count(), 2)
+        self.assertIn('Удалено корзин: 3, позиций: 6', out.getvalue())
+
+
+class FailingTransport:
+    def __init__(self, error):
+        self.error = error
+
+    def send(self, chat_id, text):
+        raise self.error
+
+
+@override_settings(TELEGRAM_CHAT_IDS=[1, 2], TELEGRAM_TRANSPORT='basket.telegram.LocMemTransport')
+class TelegramOutboxTest(TestCase):
+    def setUp(self):
+        LocMemTransport.outbox = []
+
+    def test_command_sends_digest_to_every_chat(self):
+        send_message('Заказ 1')
+        send_message('Заказ 2')
+        call_command('send_notifications', '--once', stdout=StringIO())
+        self.assertEqual(sorted(LocMemTransport.outbox), [(1, 'Заказ 1\n\nЗаказ 2'), (2, 'Заказ 1\n\nЗаказ 2')])
+        self.assertFalse(TelegramNotification.objects.filter(sent_at__isnull=True).exists())
+
+    def test_long_digests_are_split(self):
+        for _ in range(3):
+            send_message('x' * (MESSAGE_LIMIT // 3))
+        deliver_notifications(LocMemTransport())
+        self.assertEqual(len(LocMemTransport.outbox), 4)
+        self.assertTrue(all(len(text) <= MESSAGE_LIMIT for _, text in LocMemTransport.outbox))
+
+    def test_failure_is_retried_with_backoff(self):
+        send_message('Заказ')
+        self.assertEqual(deliver_notifications(FailingTransport(ConnectionError('timeout'))), (0, 2))
+        notification = TelegramNotification.objects.first()
+        self.assertEqual(notification.attempts, 1)
+        self.assertEqual(notification.last_error, 'timeout')
+        self.assertGreater(notification.next_attempt_at, timezone.now())
+        self.assertEqual(deliver_notifications(LocMemTransport()), (0, 0))
+
+        TelegramNotification.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(deliver_notifications(LocMemTransport()), (2, 0))
+
+    def test_rate_limit_does_not_spend_attempts(self):
+        send_message('Заказ')
+        deliver_notifications(FailingTransport(RateLimited(30)))
+        notification = TelegramNotification.objects.first()
+        self.assertEqual(notification.attempts, 0)
+        self.assertGreater(notification.next_attempt_at, timezone.now() + timedelta(seconds=20))
+
+
+class CartConstraintsMigrationTest(TransactionTestCase):
+    migrate_from = [('basket', '0014_order_phone_number_index')]
+    migrate_to = [('basket', '0015_cart_constraints_order_indexes')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def test_duplicates_are_merged_before_constraints(self):
+        apps = self.migrate(self.migrate_from)
+        try:
+            # Without the constraints nothing stops duplicates, like in an old database
+            OldCart, OldCartItem = apps.get_model('basket', 'Cart'), apps.get_model('basket', 'CartItem')
+            user = CustomUser.objects.create_user(email='u@example.com', username='u', password='x')  # Not migrated
+            first, second = (apps.get_model('basket', 'Product').objects.create(name=name, description='', price=100)
+                             for name in 'AB')
+            old, new = OldCart.objects.create(user_id=user.pk), OldCart.objects.create(user_id=user.pk)
+            OldCartItem.objects.bulk_create([
+                OldCartItem(cart=old, product=first, quantity=1),
+                OldCartItem(cart=new, product=first, quantity=2),
+                OldCartItem(cart=new, product=second, quantity=1),
+                OldCartItem(cart=new, product=second, quantity=1),
+            ])
+            self.migrate(self.migrate_to)
+        finally:
+            self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+        cart = Cart.objects.get(user=user)
+        self.assertEqual(cart.pk, old.pk)
+        self.assertEqual(dict(cart.items.values_list('product_id', 'quantity')), {first.pk: 3, second.pk: 2})
+        self.assertEqual(cart.total_price, 500)
+
+
+@skipUnless(connection.vendor == 'sqlite', "EXPLAIN QUERY PLAN output is SQLite-specific")
+class HotQueryIndexTest(TestCase):
+    def assertUsesIndex(self, queryset, index):
+        plan = queryset.explain()
+        self.assertIn(index, plan)
+        self.assertNotRegex(plan, r'SCAN basket_\w+\b(?! USING)')  # No full table scans
+
+    def test_cart_and_order_queries_use_indexes(self):
+        user = CustomUser.objects.create_user(email='u@example.com', username='u', password='x')
+        self.assertUsesIndex(Cart.objects.filter(user=user).order_by('pk')[:1], 'basket_cart_unique_user')
+        self.assertUsesIndex(CartItem.objects.filter(cart_id=1, product_id=2),
+                             'sqlite_autoindex_basket_cartitem_1')  # basket_cartitem_unique_product
+        self.assertUsesIndex(Order.objects.filter(user=user).order_by('-order_date', '-id')[:50],
+                             'basket_order_user_date_idx')
+        self.assertUsesIndex(Order.objects.filter(status='pending').order_by('order_date')[:50],
+                             'basket_order_status_date_idx')
+        self.assertUsesIndex(Order.objects.filter(phone_number='+79817070306', user=None),
+                             'basket_order_phone_number')
+
+
+class OrderItemTest(TestCase):
+    def test_large_order_keeps_every_item(self):
+        create_catalog(1, products_per_category=60)
+        self.client.force_login(CustomUser.objects.create_user(email='u@example.com', username='u', password='x'))
+        for product in Product.objects.all():
+            self.client.post(reverse('basket:update_cart', args=[product.pk]), {'new_quantity': 2})
+        with self.assertNumQueries(10):  # The user comes from the auth cache
+            self.client.post(reverse('basket:checkout'), {
+                'shipping_address': 'Невский проспект, 1', 'phone_number': '+79817070306',
+            })
+        order = Order.objects.get()
+        self.assertEqual(order.items.count(), 60)
+        self.assertLessEqual(len(order.products), 1024)
+        total = order.total_price
+        order.update_total_price()
+        self.assertEqual(order.total_price, total)
+
+    def test_backfill_parses_products_string(self):
+        migration = import_module('basket.migrations.0007_backfill_orderitems')
+        matches = migration.ORDER_ITEM_RE.finditer('Шашлык: свинина: 2 шт, Лаваш, тонкий: 1 шт')
+        self.assertEqual([(m['name'], m['quantity']) for m in matches],
+                         [('Шашлык: свинина', '2'), ('Лаваш, тонкий', '1')])
+
+
+class NormalizePhonesTest(TestCase):
+    def test_backfill_converts_old_numbers_to_e164(self):
+        Order.objects.bulk_create([
+            Order(phone_number='8 981 707-03-06'),
+            Order(phone_number='+79817070306'),
+            Order(phone_number='звоните в офис'),
+            Order(phone_number=None),
+        ])
+        call_command('normalize_phones', '--batch-size', '2', stdout=StringIO())
+        self.assertEqual(list(Order.objects.order_by('pk').values_list('phone_number', flat=True)),
+                         ['+79817070306', '+79817070306', 'звоните в офис', None])
+
+
+CHECKOUT_DATA = {'shipping_address': 'Невский проспект, 1', 'phone_number': '+79817070306'}
+
+
+class IdempotentCheckoutTest(TestCase):
+    def setUp(self):
+        create_catalog(1, products_per_category=1)
+        self.product = Product.objects.get()
+
+    def test_replayed_form_returns_original_order(self):
+        self.client.post(reverse('basket:add_to_cart', args=[self.product.pk]))
+        key = self.client.get(reverse('basket:show_checkout_form')).context['form'].initial['idempotency_key']
+        for _ in range(2):
+            response = self.client.post(reverse('basket:checkout'), {**CHECKOUT_DATA, 'idempotency_key': key})
+            self.assertRedirects(response, reverse('basket:success_guest'), fetch_redirect_response=False)
+        self.assertEqual(Order.objects.get().idempotency_key, key)
+        self.assertEqual(TelegramNotification.objects.count(), len(settings.TELEGRAM_CHAT_IDS))
+
+    def test_api_replay_returns_original_order(self):
+        self.client.post('/api/carts/current/add_item/', {'product_id': self.product.pk})
+        first = self.client.post('/api/carts/current/checkout/', CHECKOUT_DATA, HTTP_IDEMPOTENCY_KEY='abc')
+        replay = self.client.post('/api/carts/current/checkout/', CHECKOUT_DATA, HTTP_IDEMPOTENCY_KEY='abc')
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(replay.status_code, 200)
+        self.assertEqual(first.json()['order_id'], replay.json()['order_id'])
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_key_of_another_customer_is_rejected(self):
+        self.client.post('/api/carts/current/add_item/', {'product_id': self.product.pk})
+        first = self.client.post('/api/carts/current/checkout/', CHECKOUT_DATA, HTTP_IDEMPOTENCY_KEY='abc')
+        other = Client()
+        other.post('/api/carts/current/add_item/', {'product_id': self.product.pk})
+        for _ in range(2):  # With items in the cart, then with an empty cart
+            response = other.post('/api/carts/current/checkout/', CHECKOUT_DATA, HTTP_IDEMPOTENCY_KEY='abc')
+            self.assertEqual(response.status_code, 409)
+            self.assertNotIn('order_id', response.json())
+            other.post('/api/carts/current/batch/', {'operations': [{'op': 'remove', 'product_id': self.product.pk}]},
+                       content_type='application/json')
+        self.assertEqual(Order.objects.get().pk, first.json()['order_id'])
+
+    def test_checkout_without_key_needs_items(self):
+        self.client.post('/api/carts/current/add_item/', {'product_id': self.product.pk})
+        self.client.post('/api/carts/current/checkout/', CHECKOUT_DATA)
+        response = self.client.post('/api/carts/current/checkout/', CHECKOUT_DATA)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Order.objects.count(), 1)
+
+
+@override_settings(
+    REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {
+        **settings.REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'], 'checkout': '2/minute',
+    }},
+    API_THROTTLE_STORE='api.throttling.MemoryCounterStore',
+)
+class CheckoutThrottleTest(TestCase):
+    def setUp(self):
+        self.enterContext(patch('api.throttling.time', return_value=1_000_000.0))  # One fixed window
+
+    def tearDown(self):
+        get_counter_store().clear()
+
+    def test_form_checkout_is_limited(self):
+        create_catalog(1, products_per_category=1)
+        product = Product.objects.get()
+        statuses = []
+        for _ in range(3):
+            self.client.post(reverse('basket:add_to_cart', args=[product.pk]))
+            statuses.append(self.client.post(reverse('basket:checkout'), CHECKOUT_DATA).status_code)
+        self.assertEqual(statuses, [302, 302, 429])
+        self.assertEqual(Order.objects.count(), 2)
+
+
+class ConcurrentCheckoutTest(TransactionTestCase):
+    threads = 5
+
+    def fire(self, client, url=None, **headers):
+        url = url or f'/api/carts/{self.cart.pk}/checkout/'
+        barrier = Barrier(self.threads)
+        responses = []
+
+        def checkout():
+            barrier.wait()
+            try:
+                responses.append(client.post(url, CHECKOUT_DATA, headers=headers))
+            finally:
+                close_old_connections()
+
+        workers = [Thread(target=checkout) for _ in range(self.threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return responses
+
+    def setUp(self):
+        cache.clear()  # Checkout throttle counters of earlier tests (same user ids)
+        create_catalog(1, products_per_category=1)
+        user = CustomUser.objects.create_user(email='user@example.com', username='user', password='secret')
+        self.client = Client(raise_request_exception=False)
+        self.client.force_login(user)
+        self.cart = Cart.objects.create(user=user)
+        self.client.post(f'/api/carts/{self.cart.pk}/add_item/', {'product_id': Product.objects.get().pk})
+
+    def test_parallel_checkouts_create_one_order(self):
+        responses = self.fire(self.client)
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(sorted(r.status_code for r in responses).count(201), 1)
+
+    def test_parallel_replays_return_same_order(self):
+        responses = self.fire(self.client, idempotency_key='same-key')
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual({r.json()['order_id'] for r in responses}, {Order.objects.get().pk})
+
+    def test_parallel_guest_checkouts_create_one_order(self):
+        guest = Client(raise_request_exception=False)
+        guest.post('/api/carts/current/add_item/', {'product_id': Product.objects.get().pk})
+        responses = self.fire(guest, '/api/carts/current/checkout/')
+        self.assertEqual(Order.objects.filter(user=None).count(), 1)
+        self.assertEqual(sorted(r.status_code for r in responses), [201, 400, 400, 400, 400])
+        self.assertNotIn('cart', guest.session)
@@ -0,0 +1,67 @@
+from easy_thumbnails.alias import aliases
+from easy_thumbnails.files import get_thumbnailer
+
+from .models import Product
+
+ALIAS_TARGET = 'basket.Product.image'
+# Форматы миниатюр: WebP для браузеров, которые его понимают, JPEG для остальных
+THUMBNAIL_FORMATS = ('webp', 'jpg')
+# Размеры картинок на странице для атрибута sizes
+PICTURE_SIZES = {
+    'card': '(max-width: 576px) 100vw, 400px',
+    'cart': '50px',
+    'detail': '(max-width: 768px) 100vw, 600px',
+}
+
+
+def _thumbnailer(image, extension):
+    # image: FieldFile or the file name stored in the database (values())
+    thumbnailer = get_thumbnailer(Product._meta.get_field('image').storage, getattr(image, 'name', image))
+    thumbnailer.thumbnail_extension = extension
+    thumbnailer.thumbnail_transparency_extension = extension
+    thumbnailer.thumbnail_preserve_extensions = False
+    return thumbnailer
+
+
+def thumbnail_url(image, alias, extension='jpg'):
+    """
+    URL миниатюры без обращения к базе и хранилищу: имя файла вычисляется из настроек
+    алиаса, а сами файлы создаются заранее generate_thumbnails.
+    """
+    thumbnailer = _thumbnailer(image, extension)
+    options = aliases.get(alias, target=ALIAS_TARGET)
+    return thumbnailer.thumbnail_storage.url(thumbnailer.get_thumbnail_name(options))
+
+
+def thumbnail_srcset(image, alias, extension='jpg'):
+    """
+    srcset из алиаса и его варианта _2x с шириной каждой картинки.
+    """
+    variants = []
+    for name in (alias, f'{alias}_2x'):
+        width = aliases.get(name, target=ALIAS_TARGET)['size'][0]
+        variants.append(f'{thumbnail_url(image, name, extension)} {width}w')
+    return ', '.join(variants)
+
+
+def thumbnail_urls(image, build_url=None):
+    """
+    Все размеры миниатюр для API: {алиас: {формат: url}}.
+    """
+    if not image:
+        return None
+    build_url = build_url or (lambda url: url)
+    return {
+        alias: {extension: build_url(thumbnail_url(image, alias, extension)) for extension in THUMBNAIL_FORMATS}
+        for alias in aliases.all(ALIAS_TARGET, include_global=False)
+    }
+
+
+def generate_thumbnails(image):
+    """
+    Создание всех миниатюр картинки во всех форматах.
+    """
+    for alias, options in aliases.all(ALIAS_TARGET, include_global=False).items():
+        for extension in THUMBNAIL_FORMATS:
+            _thumbnailer(image, extension).get_thumbnail(dict(options, ALIAS=alias))
+
@@ -14,6 +14,7 @@ urlpatterns = [
     path('cart/', views.cart_detail, name='cart_detail'),
     path('', views.product_list, name='product_list'),
     path('products/<int:product_id>/', views.product_detail, name='product_detail'),
+    path('search/', views.search, name='search'),
     # ... other URL patterns ...
 
     path('checkout/', views.checkout, name='checkout'),
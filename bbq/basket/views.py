@@ -1,86 +1,63 @@
 import logging
+from uuid import uuid4
 
 from django.contrib import messages
-from django.core.exceptions import ObjectDoesNotExist
 from django.http import HttpResponseRedirect, JsonResponse, HttpResponse, Http404
-from django.shortcuts import render, redirect, get_object_or_404
+from django.shortcuts import render, redirect
 from django.views.decorators.http import require_POST
 
+from api.throttling import throttle
+from .catalog import get_catalog
+from .checkout import EmptyCartError, IdempotencyKeyReused, place_order
+from .conditional import catalog_state, page_condition
 from .forms import OrderForm
-from .models import Product, Cart, CartItem, Order, Category
-from .telegram import send_message
+from .models import Product
+from .search import search_products
 
 
+@page_condition
 def product_detail(request, product_id):
-    product = get_object_or_404(Product, id=product_id)
+    product = get_catalog(catalog_state(request)[0]).products_by_id.get(product_id)
+    if product is None:
+        raise Http404
     return render(request, 'product_detail.html', {'product': product})
 
+@page_condition
 def category_detail(request, slug):
-    category = get_object_or_404(Category, slug=slug)
-    products = category.products.all()  # Получаем все продукты, связанные с этой категорией
-    current_category = get_object_or_404(Category, slug=slug)
-    context = {'category': category, 'products': products, 'categories': Category.objects.all(), 'current_category': current_category}
+    catalog = get_catalog(catalog_state(request)[0])
+    category = catalog.categories_by_slug.get(slug)
+    if category is None:
+        raise Http404
+    products = catalog.products_by_category[category]  # Получаем все продукты, связанные с этой категорией
+    context = {'category': category, 'products': products, 'categories': catalog.categories, 'current_category': category}
     return render(request, 'category_detail.html', context)
+@page_condition
 def product_list(request):
-    categories = Category.objects.all()  # Fetch all categories
-    products = Product.objects.all()  # Fetch all products
+    catalog = get_catalog(catalog_state(request)[0])  # Categories with their products, rebuilt only when the catalog changes
+    categories = catalog.categories
+    products = catalog.products
+    products_by_category = catalog.products_by_category
 
-    try:
-        if request.user.is_authenticated:
-            cart = Cart.objects.get(user=request.user)
-        else:
-            cart_id = request.session.get('cart_id')
-            if cart_id is None:
-                cart = Cart.objects.create()
-                request.session['cart_id'] = cart.id
-            else:
-                cart = Cart.objects.get(id=cart_id)
-    except Cart.DoesNotExist:
-        cart = Cart.objects.create()
-        if request.user.is_authenticated:
-            cart.user = request.user
-            cart.save()
-        request.session['cart_id'] = cart.id
-
-    cart_items = cart.items.all()
-    cart_count = sum(item.quantity for item in cart_items)
-
-    # Now, group products by category
-    products_by_category = {}
-    for category in categories:
-        products_in_category = Product.objects.filter(category=category)
-        products_by_category[category] = products_in_category
+    cart_count = request.cart.count
 
     return render(request, 'product_list.html', {'products': products, 'cart_count': cart_count, 'categories': categories, 'products_by_category': products_by_category})
 
 
+@page_condition
+def search(request):
+    query = request.GET.get('q', '').strip()
+    products_by_id = get_catalog(catalog_state(request)[0]).products_by_id
+    products = [products_by_id[pk] for pk in search_products(query) if pk in products_by_id] if query else []
+    return render(request, 'search.html', {'query': query, 'products': products, 'cart_count': request.cart.count})
+
+
 def add_to_cart(request, product_id):
-    product = get_object_or_404(Product, id=product_id)
+    product = get_catalog().products_by_id.get(product_id)
+    if product is None:
+        raise Http404
 
-    if request.user.is_authenticated:
-        try:
-            cart = Cart.objects.get(user=request.user)
-        except Cart.DoesNotExist:
-            cart = Cart.objects.create(user=request.user)
-            request.session['cart_id'] = cart.id
-    else:
-        try:
-            cart_id = request.session.get('cart_id')
-            cart = Cart.objects.get(id=cart_id)
-        except Cart.DoesNotExist:
-            cart = Cart.objects.create()
-            request.session['cart_id'] = cart.id
-
-    try:
-        cart_item = CartItem.objects.get(product=product, cart=cart)
-        cart_item.quantity += 1
-        cart_item.save()
-    except CartItem.DoesNotExist:
-        cart_item = CartItem.objects.create(product=product, cart=cart)
-        cart_item.save()
-    cart.update_total_price()
-    cart_items = cart.items.all()
-    cart_count = sum(item.quantity for item in cart_items)
+    request.cart.add(product.pk)
+    cart_count = request.cart.count
     request.session['cart_count'] = cart_count + 1
 
     response = HttpResponseRedirect(request.META.get('HTTP_REFERER', '/'))
@@ -97,79 +74,26 @@ def update_cart(request, product_id):
             if new_quantity < 1:
                 return redirect('basket:cart_detail')  # Redirect to cart if quantity is invalid.
 
-            if request.user.is_authenticated:
-                cart, _ = Cart.objects.get_or_create(user=request.user)
-            else:
-                # Get or create cart based on session if not logged in.
-                cart_id = request.session.get('cart_id')
-                if cart_id:
-                    cart = Cart.objects.get(id=cart_id)
-                else:
-                    cart = Cart.objects.create(user=None)
-                    request.session['cart_id'] = cart.id
-            try:
-                cart_item = CartItem.objects.get(product_id=product_id, cart=cart)
-                cart_item.quantity = new_quantity
-                cart_item.save()
-                cart.update_total_price()
-                return redirect('basket:cart_detail')
-            except CartItem.DoesNotExist:
-                # Handle the case where the cart item doesn't exist
-                product = Product.objects.get(id=product_id)
-                new_cart_item = CartItem(cart=cart, product=product, quantity=new_quantity)
-                new_cart_item.save()
-                cart.update_total_price()
-                return redirect('basket:cart_detail')
+            # Creates the line if the cart item doesn't exist
+            request.cart.set(product_id, new_quantity)
+            return redirect('basket:cart_detail')
 
         except (ValueError, Product.DoesNotExist) as e:  # Catch more specific errors
             print(f"Invalid input or product not found: {e}")
-            return redirect('cart_detail')  # Redirect to cart detail page
+            return redirect('basket:cart_detail')  # Redirect to cart detail page
     else:
         return redirect('basket:cart_detail')
 
 
 def remove_from_cart(request, product_id):
-    try:
-        # Check if the user is logged in.
-        if request.user.is_authenticated:
-            cart = Cart.objects.get(user=request.user)  # Use .get for checking if user is authenticated
-        else:
-            # Guest User Handling (important)
-            cart_id = request.session.get('cart_id')
-            if not cart_id:
-                return redirect('basket:cart_detail')  # Redirect to cart if no cart found for guest
-            cart = Cart.objects.get(id=cart_id)
-
-        cart_item = CartItem.objects.get(product_id=product_id, cart=cart)
-        cart_item.delete()
-        cart.update_total_price()  # Important: Update the cart total.
-        return redirect('basket:cart_detail')
-    except ObjectDoesNotExist:
-        return redirect('basket:cart_detail')
+    request.cart.remove(product_id)  # Important: updates the cart total.
+    return redirect('basket:cart_detail')
 
 
 def cart_detail(request):
     # Handle both logged-in and guest users
-    try:
-        if request.user.is_authenticated:
-            cart = Cart.objects.get(user=request.user)
-        else:
-            cart_id = request.session.get('cart_id')  # Check for session cart
-            if cart_id is None:
-                cart = Cart.objects.create()
-                request.session['cart_id'] = cart.id
-            else:
-                cart = Cart.objects.get(id=cart_id)
-    except Cart.DoesNotExist:
-        # Handle case where a cart with the session ID does not exist.
-        cart = Cart.objects.create()
-        if request.user.is_authenticated:
-            cart.user = request.user
-            cart.save()
-        request.session['cart_id'] = cart.id
-
-    cart_items = cart.items.all()
-    total_price = sum(item.total_price for item in cart_items)
+    cart_items = request.cart.items
+    total_price = request.cart.total_price
 
     return render(request, 'cart.html', {'cart_items': cart_items, 'total_price': total_price})
 
@@ -179,80 +103,38 @@ logger = logging.getLogger(__name__)
 
 
 def show_checkout_form(request):
-    try:
-        if request.user.is_authenticated:
-            cart, created = Cart.objects.get_or_create(user=request.user)
-        else:
-            cart_id = request.session.get('cart_id')
-            if cart_id:
-                cart = Cart.objects.get(pk=cart_id)
-            else:
-                messages.error(request, "Ошибка: Корзина не найдена. Пожалуйста, добавьте товары в корзину.")
-                return redirect('basket:cart_detail')  # Corrected redirect
-
-        if not cart.items.exists():
-            messages.warning(request, "Ваша корзина пуста. Пожалуйста, добавьте товары.")
-            return redirect('basket:product_list')
-
-        form = OrderForm(initial={'cart': cart.id})
-        return render(request, 'order.html', {'form': form})
-
-    except Cart.DoesNotExist:
-        messages.error(request, "Ошибка: Корзина не найдена. Пожалуйста, добавьте товары в корзину.")
+    if not request.cart.items:
+        messages.warning(request, "Ваша корзина пуста. Пожалуйста, добавьте товары.")
         return redirect('basket:product_list')
 
+    form = OrderForm(initial={'idempotency_key': uuid4().hex})
+    return render(request, 'order.html', {'form': form})
+
 
 @require_POST
+@throttle('checkout')  # Same limit as the API checkout: every order queues Telegram messages
 def checkout(request):
     if request.method == 'POST':
         form = OrderForm(request.POST)
         if form.is_valid():
-            try:
-                if request.user.is_authenticated:
-                    cart = Cart.objects.get(user=request.user)
-                else:
-                    cart_id = request.session.get('cart_id')
-                    if not cart_id:
-                        messages.error(request, "Ошибка: Корзина не найдена. Пожалуйста, добавьте товары.")
-                        return redirect('basket:show_checkout_form')
-                    cart = Cart.objects.get(pk=cart_id)
-            except Cart.DoesNotExist:
-
-                messages.error(request, "Ошибка: Корзина не найдена.")
-                return redirect('basket:show_checkout_form')
-            if not cart.items.exists():
-                messages.error(request, "Ваша корзина пуста.")
-                return redirect('basket:show_checkout_form')
             cleaned_data = form.cleaned_data
 
-            order_items_string = ", ".join(
-                [f"{item.product.name}: {item.quantity} шт" for item in cart.items.all()]
-            )
             order = form.save(commit=False)
 
             # order.user = cleaned_data.get('name', '').strip()
-            order.products = ord  # Assign cart to Order
-
             order.shipping_address = cleaned_data.get('shipping_address', '').strip()
             order.phone_number = cleaned_data.get('phone_number')
             order.message = cleaned_data.get('message', '').strip()
-            order.total_price = cart.total_price
             order.status = 'Ожидается'  # Initialize status
 
             try:
-                order.save()
-            except Exception as e: print(e)
-            send_message(
-
-               f'Номер заказа: {order.pk}\n '
-               f'Телефон: {order.phone_number}\n'
-               f'Адрес: {order.shipping_address}\n'
-               f'заказ: {order_items_string}\n'
-               f'Общая сумма {cart.total_price}руб\n'
-               f'Дополнительная информация'
-            )
-            cart.delete()
-
+                order, created = place_order(request, order, cleaned_data.get('idempotency_key'))
+            except EmptyCartError:
+                messages.error(request, "Ваша корзина пуста.")
+                return redirect('basket:show_checkout_form')
+            except IdempotencyKeyReused:
+                messages.error(request, "Форма устарела, пожалуйста, отправьте её ещё раз.")
+                return redirect('basket:show_checkout_form')
 
             messages.success(request, "Ваш заказ успешно оформлен!")
 
@@ -56,10 +56,26 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
+        'api.authentication.SignedTokenAuthentication',  # Mobile app: Bearer token from /api/token/
         'rest_framework.authentication.SessionAuthentication',
         'rest_framework.authentication.BasicAuthentication',
     ],
+    # Limits for the actions listed in throttle_scopes of the viewsets (api.throttling)
+    'DEFAULT_THROTTLE_CLASSES': [
+        'api.throttling.ActionRateThrottle',
+    ],
+    'DEFAULT_THROTTLE_RATES': {
+        'cart_create': env("THROTTLE_CART_CREATE", default="60/hour"),
+        'checkout': env("THROTTLE_CHECKOUT", default="20/hour"),
+        'order_lookup': env("THROTTLE_ORDER_LOOKUP", default="30/hour"),
+        'token': env("THROTTLE_TOKEN", default="20/hour"),
+    },
 }
+# Throttle counters: CacheCounterStore (shared through CACHES) or MemoryCounterStore (this process only)
+API_THROTTLE_STORE = "api.throttling.CacheCounterStore"
+# Lifetime of API tokens (api.tokens), seconds
+API_ACCESS_TOKEN_TTL = 15 * 60
+API_REFRESH_TOKEN_TTL = 30 * 24 * 60 * 60
 CORS_ALLOWED_ORIGINS = [
     'http://localhost:19006',  # Expo development server
     'http://127.0.0.1:19006',  # Alternative Expo development server
@@ -82,6 +98,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'basket.middleware.CartMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -114,6 +131,12 @@ WSGI_APPLICATION = 'bbq.wsgi.application'
 DATABASES = {
     "default": env.db(),
 }
+if DATABASES["default"]["ENGINE"] == "django.db.backends.sqlite3":
+    # SQLite ignores SELECT ... FOR UPDATE: take the write lock when a transaction starts,
+    # so concurrent checkouts wait for each other instead of failing with "database is locked".
+    DATABASES["default"].setdefault("OPTIONS", {}).setdefault("transaction_mode", "IMMEDIATE")
+    # The in-memory test database uses a shared cache that errors out instead of waiting on locks
+    DATABASES["default"].setdefault("TEST", {}).setdefault("NAME", os.path.join(BASE_DIR, "test_db.sqlite3"))
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -159,11 +182,45 @@ MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 MEDIA_URL = "/media/"
 
 AUTH_USER_MODEL = "authapp.CustomUser"
+# Login by email (any case) or username; users of authenticated requests are cached for AUTH_USER_CACHE_TIMEOUT
+AUTHENTICATION_BACKENDS = ["authapp.backend.UserModelBackend"]
+AUTH_USER_CACHE_TIMEOUT = 30  # seconds; the cache entry is also dropped when the user is saved
+
+# Shared cache (e.g. redis:// or memcache://) in production so invalidation reaches every process
+CACHES = {"default": env.cache("CACHE_URL", default="locmemcache://")}
 SITE_ID = 1
 
+# Guest carts untouched for this many days are removed by the purge_carts command
+CART_TTL_DAYS = 30
+
+# Order notifications are queued in basket.TelegramNotification and sent by send_notifications
+TELEGRAM_CHAT_IDS = env.list("TELEGRAM_CHAT_IDS", cast=int, default=[7169510671, 939130884])
+TELEGRAM_TRANSPORT = "basket.telegram.BotTransport"
+TELEGRAM_MAX_ATTEMPTS = 10
+TELEGRAM_RETRY_BASE = 5  # seconds, doubled after every failed attempt
+TELEGRAM_RETRY_MAX = 3600
+
+# Product photos are served as thumbnails built by the process_images worker (existing photos are
+# backfilled with generate_thumbnails); the original is served until the worker has run.
+# Every size has a 2x variant for srcset; each alias is stored as WebP and JPEG.
+THUMBNAIL_ALIASES = {
+    "basket.Product.image": {
+        "card": {"size": (400, 300), "crop": True},
+        "card_2x": {"size": (800, 600), "crop": True},
+        "cart": {"size": (50, 50), "crop": True},
+        "cart_2x": {"size": (100, 100), "crop": True},
+        "detail": {"size": (600, 0)},
+        "detail_2x": {"size": (1200, 0)},
+    },
+}
+THUMBNAIL_QUALITY = 80
+
 CRISPY_TEMPLATE_PACK = "bootstrap5"
 CRISPY_ALLOWED_TEMPLATE_PACKS = "bootstrap5"
 
+# Generated sitemap files (bbq.sitemaps), one directory per catalog version
+SITEMAP_ROOT = os.path.join(BASE_DIR, "sitemap_cache")
+
 ROBOTS_SITEMAP_URLS = [
     'https://onthefarm.ru/sitemap.xml',
 ]
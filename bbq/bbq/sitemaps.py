@@ -1,27 +1,163 @@
-from django.contrib import sitemaps
-from django.contrib.sitemaps import Sitemap
+import gzip
+import os
+import shutil
+from pathlib import Path
+from threading import Lock
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.contrib.sites.models import Site
+from django.http import FileResponse, Http404, StreamingHttpResponse
 from django.urls import reverse
 
-from basket.models import Product
+from basket.catalog import get_catalog_state
+from basket.models import Category, Product
+
+SITEMAP_LIMIT = 50000  # Не больше 50 000 адресов в одном файле по протоколу sitemaps.org
+PROTOCOL = 'https'
+INDEX_NAME = 'sitemap.xml'
+
+_lock = Lock()
+
+
+def _lastmod(value):
+    return f'<lastmod>{value.isoformat(timespec="seconds")}</lastmod>' if value else ''
+
+
+class SectionWriter:
+    """
+    Запись раздела карты сайта в gzip-файлы по limit адресов: sitemap-<раздел>-<номер>.xml.gz.
+    Строки пишутся сразу в файл, в памяти держится только текущий файл и его lastmod.
+    """
+
+    def __init__(self, directory, section, limit):
+        self.directory = directory
+        self.section = section
+        self.limit = limit
+        self.files = []  # (имя файла, lastmod)
+        self.file = None
+        self.count = 0
+
+    def add(self, location, lastmod=None):
+        if self.file is None or self.count == self.limit:
+            self.close_file()
+            name = f'sitemap-{self.section}-{len(self.files) + 1}.xml'
+            self.file = gzip.open(self.directory / f'{name}.gz', 'wt', encoding='utf-8')
+            self.file.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                            '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n')
+            self.files.append([name, None])
+            self.count = 0
+        self.file.write(f'<url><loc>{escape(location)}</loc>{_lastmod(lastmod)}</url>\n')
+        self.count += 1
+        if lastmod and (self.files[-1][1] is None or lastmod > self.files[-1][1]):
+            self.files[-1][1] = lastmod
+
+    def close_file(self):
+        if self.file is not None:
+            self.file.write('</urlset>\n')
+            self.file.close()
+            self.file = None
+
+
+def sections(catalog_updated_at):
+    """
+    Разделы карты сайта: пары (путь, lastmod) без загрузки моделей целиком.
+    """
+    yield 'static', [
+        (reverse('basket:product_list'), catalog_updated_at),
+        (reverse('basket:about'), None),
+    ]
+    yield 'categories', (
+        (reverse('basket:category_detail', args=[slug]), updated_at)
+        for slug, updated_at in Category.objects.order_by('pk').values_list('slug', 'updated_at').iterator()
+    )
+    yield 'products', (
+        (reverse('basket:product_detail', args=[pk]), updated_at)
+        for pk, updated_at in Product.objects.order_by('pk').values_list('pk', 'updated_at').iterator(chunk_size=2000)
+    )
+
+
+def directory_name(version, updated_at):
+    # The number alone can repeat (a restored database, a rolled back transaction), the time of the change can't
+    return f'{version}-{int(updated_at.timestamp() * 1000000)}' if updated_at else str(version)
+
+
+def generate_sitemaps(version=None, updated_at=None, limit=SITEMAP_LIMIT):
+    """
+    Запись индекса и разделов карты сайта в SITEMAP_ROOT/<версия каталога>/.
+    Файлы пишутся во временный каталог, который подменяет готовый целиком:
+    в существующий каталог ничего не дописывается. Старые версии удаляются.
+    """
+    if version is None:
+        version, updated_at = get_catalog_state()
+    root = Path(settings.SITEMAP_ROOT)
+    root.mkdir(parents=True, exist_ok=True)
+    dirname = directory_name(version, updated_at)
+    target = root / dirname
+    tmp = root / f'.{dirname}-{os.getpid()}'
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir()
 
+    base_url = f'{PROTOCOL}://{Site.objects.get_current().domain}'
+    files = []
+    for section, items in sections(updated_at):
+        writer = SectionWriter(tmp, section, limit)
+        for path, lastmod in items:
+            writer.add(base_url + path, lastmod)
+        writer.close_file()
+        files.extend(writer.files)
 
-class ProductSitemap(Sitemap):
-    changefreq = 'daily'
-    priority = 0.8
-    protocol = 'https'
+    with gzip.open(tmp / f'{INDEX_NAME}.gz', 'wt', encoding='utf-8') as index:
+        index.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                    '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n')
+        for name, lastmod in files:
+            index.write(f'<sitemap><loc>{escape(f"{base_url}/{name}")}</loc>{_lastmod(lastmod)}</sitemap>\n')
+        index.write('</sitemapindex>\n')
 
-    def items(self):
-        return Product.objects.all()
+    replaced = root / f'.old-{dirname}-{os.getpid()}'
+    try:
+        target.rename(replaced)  # A regeneration (other limit, the command) replaces the copy as a whole
+    except FileNotFoundError:
+        pass
+    try:
+        tmp.rename(target)
+    except OSError:
+        shutil.rmtree(tmp)  # Another process has just put the same version in place
+    shutil.rmtree(replaced, ignore_errors=True)
 
+    for old in root.iterdir():
+        if old.is_dir() and old.name != dirname and not old.name.startswith('.'):
+            shutil.rmtree(old, ignore_errors=True)
+    return target
 
 
-class StaticViewSitemap(sitemaps.Sitemap):
-    priority = 0.5
-    changefreq = "daily"
-    protocol = 'https'
+def get_sitemap_directory():
+    """
+    Каталог с файлами карты сайта для текущей версии каталога.
+    Перестраивается, только если каталог изменился с прошлой генерации.
+    """
+    version, updated_at = get_catalog_state()
+    directory = Path(settings.SITEMAP_ROOT) / directory_name(version, updated_at)
+    if directory.is_dir():
+        return directory
+    with _lock:
+        if directory.is_dir():
+            return directory
+        return generate_sitemaps(version, updated_at)
 
-    def items(self):
-        return ["basket:about", ]
 
-    def location(self, item):
-        return reverse(item)
+def sitemap(request, name=INDEX_NAME):
+    """
+    Готовый файл карты сайта: gzip как есть клиентам, которые его принимают,
+    остальным — распакованный на лету.
+    """
+    path = get_sitemap_directory() / f'{name}.gz'
+    if not path.is_file():
+        raise Http404
+    if 'gzip' in request.headers.get('Accept-Encoding', ''):
+        response = FileResponse(path.open('rb'), content_type='application/xml', filename=name)
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = StreamingHttpResponse(gzip.open(path, 'rb'), content_type='application/xml')
+    response['Vary'] = 'Accept-Encoding'
+    return response
@@ -15,23 +15,18 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.contrib.sitemaps.views import sitemap
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf.urls.static import static
 
 from bbq import settings
-from bbq.sitemaps import ProductSitemap, StaticViewSitemap
+from bbq.sitemaps import sitemap
 
-sitemaps = {
-    'static': StaticViewSitemap,
-    'products': ProductSitemap,
-
-}
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('basket.urls')),
     path('robots.txt', include('robots.urls')),
-    path('sitemap.xml', sitemap, {'sitemaps': sitemaps}, name='django.contrib.sitemaps.views.sitemap'),
+    # Pre-rendered index and sections, rebuilt only when the catalog version changes
+    re_path(r'^(?P<name>sitemap(?:-[a-z]+-\d+)?\.xml)$', sitemap, name='sitemap'),
     # path('auth/', include('authapp.urls')),
     path('api/', include('api.urls')),
 ]
@@ -0,0 +1,57 @@
+"""
+Нагрузочные замеры. Пакет не входит в INSTALLED_APPS и не трогает рабочую базу:
+каждый запуск создаёт отдельную базу (как тестовый раннер, с миграциями),
+работает с локальным кэшем процесса и удаляет базу в конце.
+Запуск из каталога с manage.py:
+
+    python -m benchmarks.search --products 50000
+"""
+import argparse
+import os
+import tempfile
+from time import perf_counter
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'bbq.settings')
+django.setup()
+
+from django.db import connection  # noqa: E402
+from django.test import override_settings  # noqa: E402
+
+LOCAL_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def measure(function, repeat):
+    """
+    Среднее время одного вызова function, секунды.
+    """
+    started = perf_counter()
+    for _ in range(repeat):
+        function()
+    return (perf_counter() - started) / repeat
+
+
+def parser(description):
+    return argparse.ArgumentParser(description=description.strip().splitlines()[0])
+
+
+def run(main, arguments, database=True):
+    """
+    Вызов main(**аргументы командной строки) в отдельной базе benchmark_*
+    и с кэшем только этого процесса: счётчики и пользователи не попадают в общий кэш.
+    """
+    options = vars(arguments.parse_args())
+    with override_settings(CACHES=LOCAL_CACHE):
+        if not database:
+            return main(**options)
+        test = connection.settings_dict.setdefault('TEST', {})
+        if connection.vendor == 'sqlite':
+            test['NAME'] = os.path.join(tempfile.gettempdir(), f'bbq-benchmark-{os.getpid()}.sqlite3')
+        else:
+            test['NAME'] = f'benchmark_{connection.settings_dict["NAME"]}'
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            return main(**options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
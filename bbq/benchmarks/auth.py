@@ -0,0 +1,44 @@
+"""
+Время поиска пользователя при входе и загрузки пользователя запроса.
+
+    python -m benchmarks.auth --users 100000
+"""
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.db.models import Q
+from django.db.models.functions import Lower
+
+from authapp.backend import UserModelBackend
+from authapp.models import CustomUser
+from benchmarks import measure, parser, run
+
+
+def main(users, repeat):
+    password = make_password('benchmark')
+    backend = UserModelBackend()
+    created = CustomUser.objects.bulk_create(
+        (CustomUser(username=f'bench{i}', email=f'Bench.User{i}@Example.com', password=password)
+         for i in range(users)),
+        batch_size=2000,
+    )
+    login = f'bench.user{users // 2}@example.com'
+    old = CustomUser.objects.filter(Q(username=login) | Q(email__iexact=login))
+    new = CustomUser.objects.annotate(email_lower=Lower('email')).filter(
+        Q(username=login) | Q(email_lower=login.lower()))
+    print(f"iexact:\n{old.explain()}\nLOWER(email):\n{new.explain()}")
+    print(f"Поиск по email__iexact: {measure(lambda: list(old.all()), repeat) * 1000:.3f} мс")
+    print(f"Поиск по LOWER(email): {measure(lambda: list(new.all()), repeat) * 1000:.3f} мс")
+
+    user_id = created[-1].pk
+    cache.delete(f'auth:user:{user_id}')
+    print(f"get_user из базы: {measure(lambda: CustomUser.objects.get(pk=user_id), repeat) * 1000:.3f} мс")
+    backend.get_user(user_id)
+    print(f"get_user из кэша: {measure(lambda: backend.get_user(user_id), repeat) * 1000:.3f} мс")
+    print(f"Пользователей: {users}")
+
+
+if __name__ == '__main__':
+    arguments = parser(__doc__)
+    arguments.add_argument('--users', type=int, default=100000)
+    arguments.add_argument('--repeat', type=int, default=200)
+    run(main, arguments)
@@ -0,0 +1,37 @@
+"""
+Сравнение ProductSerializer и serialize_products на каталогах разного размера.
+
+    python -m benchmarks.products 1000 10000
+"""
+from django.test import RequestFactory
+
+from api.serializers import ProductSerializer, serialize_products
+from basket.models import Category, Product
+from benchmarks import measure, parser, run
+
+
+def main(sizes, repeat):
+    request = RequestFactory().get('/api/products/')
+    for size in sizes:
+        categories = Category.objects.bulk_create(
+            Category(name=f'benchmark-{size}-{i}', slug=f'benchmark-{size}-{i}') for i in range(10)
+        )
+        Product.objects.bulk_create(
+            Product(name=f'Товар {i}', description='Описание ' * 10, price=i, gram=250,
+                    image=f'products/{i}.jpg', category=categories[i % 10])
+            for i in range(size)
+        )
+        queryset = Product.objects.filter(category__in=categories)
+        slow = measure(lambda: ProductSerializer(
+            queryset.select_related('category'), many=True, context={'request': request}
+        ).data, repeat)
+        fast = measure(lambda: serialize_products(queryset, request), repeat)
+        print(f"{size} продуктов: ProductSerializer {slow * 1000:.1f} мс, "
+              f"serialize_products {fast * 1000:.1f} мс, x{slow / fast:.1f}")
+
+
+if __name__ == '__main__':
+    arguments = parser(__doc__)
+    arguments.add_argument('sizes', nargs='*', type=int, default=[1000, 10000])
+    arguments.add_argument('--repeat', type=int, default=5)
+    run(main, arguments)
@@ -0,0 +1,42 @@
+"""
+Время поисковых запросов на синтетическом каталоге.
+
+    python -m benchmarks.search --products 50000
+"""
+from random import Random
+
+from basket.models import Category, Product
+from basket.search import get_search_backend, search_products
+from benchmarks import measure, parser, run
+
+WORDS = ['шашлык', 'свинина', 'говядина', 'баранина', 'курица', 'крылышки', 'люля', 'кебаб', 'лаваш', 'соус',
+         'томатный', 'острый', 'сочный', 'маринованный', 'угли', 'овощи', 'гриль', 'картофель', 'грибы', 'сыр']
+QUERIES = ['шашлыки', 'свинин', 'острый соус', 'крыл', 'говядина на углях', 'сыр', 'маринованные овощи']
+
+
+def main(products, repeat):
+    random = Random(0)
+    backend = get_search_backend()
+    # Menu words are mixed with a large synthetic vocabulary, like in a real catalog
+    vocabulary = [''.join(random.choice('абвгдежзиклмнопрстуфхцчшэюя') for _ in range(7)) for _ in range(5000)]
+    category = Category.objects.create(name='benchmark-search', slug='benchmark-search')
+    created = Product.objects.bulk_create(
+        Product(name=f'{random.choice(WORDS)} {" ".join(random.sample(vocabulary, 2))}',
+                description=' '.join(random.sample(vocabulary, 8) + random.sample(WORDS, 1)),
+                price=100, category=category)
+        for _ in range(products)
+    )
+    for start in range(0, len(created), 1000):
+        backend.index(created[start:start + 1000])
+
+    for query in QUERIES:
+        elapsed = measure(lambda: search_products(query), repeat)
+        print(f"{query!r}: {elapsed * 1000:.2f} мс, найдено {len(search_products(query))}")
+    print(f"{type(backend).__name__}, продуктов: {products}")
+
+
+if __name__ == '__main__':
+    arguments = parser(__doc__)
+    arguments.add_argument('--products', type=int, default=50000)
+    arguments.add_argument('--repeat', type=int, default=20)
+    run(main, arguments)
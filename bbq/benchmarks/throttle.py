@@ -0,0 +1,59 @@
+"""
+Накладные расходы ActionRateThrottle на запрос для каждого хранилища счётчиков.
+
+    python -m benchmarks.throttle --requests 100000 --threads 8
+"""
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.test import override_settings
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api.throttling import ActionRateThrottle
+from benchmarks import parser, run
+
+STORES = ['api.throttling.MemoryCounterStore', 'api.throttling.CacheCounterStore']
+
+
+class View:
+    action = 'checkout'
+    throttle_scopes = {'checkout': 'benchmark'}
+
+
+def run_clients(count, offset=0):
+    factory = APIRequestFactory()
+    view = View()
+    requests = []
+    for i in range(1000):  # 1000 clients, so the limit is never reached
+        request = Request(factory.post('/api/carts/1/checkout/', REMOTE_ADDR=f'10.{offset}.{i // 256}.{i % 256}'))
+        request.user = AnonymousUser()
+        requests.append(request)
+    throttle = ActionRateThrottle()
+    started = perf_counter()
+    for i in range(count):
+        throttle.allow_request(requests[i % 1000], view)
+    return perf_counter() - started
+
+
+def main(requests, threads):
+    rest_framework = dict(settings.REST_FRAMEWORK, DEFAULT_THROTTLE_RATES={'benchmark': '1000000/hour'})
+    for store in STORES:
+        with override_settings(API_THROTTLE_STORE=store, REST_FRAMEWORK=rest_framework):
+            elapsed = run_clients(requests)
+            print(f"{store.rsplit('.', 1)[1]}: {elapsed / requests * 1e6:.1f} мкс на запрос")
+            per_thread = requests // threads
+            with ThreadPoolExecutor(threads) as executor:
+                started = perf_counter()
+                list(executor.map(run_clients, [per_thread] * threads, range(threads)))
+                elapsed = perf_counter() - started
+            print(f"  {threads} потоков: {requests / elapsed:.0f} запросов/с")
+
+
+if __name__ == '__main__':
+    arguments = parser(__doc__)
+    arguments.add_argument('--requests', type=int, default=100000)
+    arguments.add_argument('--threads', type=int, default=8)
+    run(main, arguments, database=False)  # Counters only, no database
@@ -0,0 +1,38 @@
+"""
+Стоимость аутентификации одного запроса API: Basic и подписанный токен.
+
+    python -m benchmarks.token_auth --repeat 20
+"""
+from base64 import b64encode
+
+from rest_framework.authentication import BasicAuthentication
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api.authentication import SignedTokenAuthentication
+from api.tokens import issue_tokens
+from authapp.models import CustomUser
+from benchmarks import measure, parser, run
+
+
+def main(repeat):
+    factory = APIRequestFactory()
+    user = CustomUser.objects.create_user(
+        email='benchmark@example.com', username='benchmark', password='benchmark-password'
+    )
+    basic = 'Basic ' + b64encode(b'benchmark@example.com:benchmark-password').decode()
+    bearer = 'Bearer ' + issue_tokens(user)['access']
+    for name, authentication, header in (
+        ('Basic', BasicAuthentication(), basic),
+        ('Bearer', SignedTokenAuthentication(), bearer),
+    ):
+        request = Request(factory.get('/api/orders/', HTTP_AUTHORIZATION=header))
+        assert authentication.authenticate(request)[0] == user
+        elapsed = measure(lambda: authentication.authenticate(request), repeat)
+        print(f"{name}: {elapsed * 1000:.3f} мс на запрос")
+
+
+if __name__ == '__main__':
+    arguments = parser(__doc__)
+    arguments.add_argument('--repeat', type=int, default=20)
+    run(main, arguments)